@@ -1,3 +1,8 @@
+import hashlib
+import os
+import subprocess
+import time
+
 import argh
 
 import markdown, mdx_latex
@@ -13,22 +18,79 @@ OPTIONA
 """
 
 
-def get_markdown(section, output):
+def _convert(md_text):
+    md.reset()  # the instance is reused across documents
+    text = md.convert(md_text)
+    text = text.replace("<root>", "").replace("</root>", "")
+    if text:
+        return section_format.replace("OPTIONA", text)
+    else:
+        return section_format
+
+
+def _convert_file(section, output):
+    started = time.perf_counter()
     with open(section, 'r') as in_file:
         md_text = in_file.read().strip()
-        with open(output, 'w') as out_file:
-            text = md.convert(md_text)
-            text = text.replace("<root>", "").replace("</root>", "")
-            if text:
-                text = section_format.replace("OPTIONA", text)
-            else:
-                text = section_format
-            out_file.write(text)
+    with open(output, 'w') as out_file:
+        out_file.write(_convert(md_text))
+    return time.perf_counter() - started
 
 
+def _output_for(section, output_dir):
+    name = os.path.splitext(os.path.basename(section))[0] + ".tex"
+    return os.path.join(output_dir, name)
+
+
+def get_markdown(section, output):
+    _convert_file(section, output)
+
+
+def batch(output_dir, *sections):
+    """
+    Convert many section files in one process, written to output_dir as .tex
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    total = 0.0
+    for section in sections:
+        elapsed = _convert_file(section, _output_for(section, output_dir))
+        total += elapsed
+        print("{}: {:.1f}ms".format(section, elapsed * 1000))
+    print("{} files: {:.1f}ms".format(len(sections), total * 1000))
+
+
+def _fingerprint(section, use_hash):
+    if use_hash:
+        with open(section, 'rb') as in_file:
+            return hashlib.sha256(in_file.read()).hexdigest()
+    return os.stat(section).st_mtime_ns
+
+
+def watch(output_dir, *sections, interval=1.0, use_hash=False, make=False, make_target="all"):
+    """
+    Reconvert section files as they change (by mtime, or content hash with
+    --use-hash), optionally running make afterwards
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    seen = {}
+    while True:
+        changed = []
+        for section in sections:
+            try:
+                fingerprint = _fingerprint(section, use_hash)
+            except FileNotFoundError:
+                continue
+            if seen.get(section) != fingerprint:
+                seen[section] = fingerprint
+                elapsed = _convert_file(section, _output_for(section, output_dir))
+                print("{}: {:.1f}ms".format(section, elapsed * 1000))
+                changed.append(section)
+        if changed and make:
+            subprocess.call(["make", make_target], cwd=os.path.dirname(os.path.abspath(__file__)))
+        time.sleep(interval)
+
 
 if __name__ == "__main__":
     p = argh.ArghParser()
-    p.add_commands([get_markdown])
+    p.add_commands([get_markdown, batch, watch])
     p.dispatch()
-
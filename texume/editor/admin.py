@@ -3,4 +3,19 @@ from django.contrib import admin
 from .models import User, Content
 
 admin.site.register(User)
-admin.site.register(Content)
+
+
+@admin.register(Content)
+class ContentAdmin(admin.ModelAdmin):
+
+    def get_fields(self, request, obj=None):
+        if obj is not None and obj.delta:
+            # older revisions are stored as deltas (see editor.revisions),
+            # shown rebuilt and not editable
+            return ['user', 'section', 'formatting', 'full_body']
+        return super().get_fields(request, obj)
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.delta:
+            return self.get_fields(request, obj)
+        return super().get_readonly_fields(request, obj)
@@ -0,0 +1,216 @@
+import collections
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FILES = ["resume.cls", "macros.tex", "user-resume.tex", "section-preview.tex"]
+# kinds of files kept in the cache
+EXTENSIONS = (".pdf", ".png")
+# eviction frees space down to this fraction of max_bytes, so the stores
+# right after it do not each walk the cache again
+EVICT_TO = 0.9
+
+
+class TemplateFingerprint:
+    """
+    Hash of the LaTeX template files, recomputed only when one of them
+    changes on disk (by mtime and size).
+    """
+
+    def __init__(self, src_dir: str, files=TEMPLATE_FILES):
+        self.src_dir = src_dir
+        self.files = list(files)
+        self._stat = None
+        self._digest = None
+        self._lock = threading.Lock()
+
+    def _current_stat(self):
+        stat = []
+        for name in self.files:
+            try:
+                st = os.stat(os.path.join(self.src_dir, name))
+                stat.append((name, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stat.append((name, None, None))
+        return tuple(stat)
+
+    @property
+    def mtime(self) -> Optional[float]:
+        """
+        Latest modification time of the template files, None if none exist.
+        """
+        mtimes = [mtime_ns for _, mtime_ns, _ in self._current_stat() if mtime_ns is not None]
+        return max(mtimes) / 1e9 if mtimes else None
+
+    @property
+    def digest(self) -> str:
+        stat = self._current_stat()
+        with self._lock:
+            if stat != self._stat:
+                sha = hashlib.sha256()
+                for name in self.files:
+                    sha.update(name.encode())
+                    try:
+                        with open(os.path.join(self.src_dir, name), 'rb') as f:
+                            sha.update(f.read())
+                    except FileNotFoundError:
+                        sha.update(b"\0missing")
+                self._stat, self._digest = stat, sha.hexdigest()
+            return self._digest
+
+
+class ArtifactCache:
+    """
+    Compiled PDFs addressed by the hash of the rendered user data and of the
+    templates they were compiled with.
+
+    Files on disk, bounded by total size and served by path (see
+    editor.delivery). Entries live in a directory per template fingerprint,
+    so a template change drops every stale artifact.
+
+    The total size is tallied as files are stored and the directory is only
+    walked once it goes over `max_bytes`; files stored by other processes
+    are counted then.
+    """
+
+    def __init__(self, directory: str, src_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fingerprint = TemplateFingerprint(src_dir)
+        self._lock = threading.RLock()
+        self._current_fingerprint = None
+        self._disk_bytes = None  # tally of stored bytes, None until first counted
+        self.counters = collections.Counter()
+
+    def key(self, user_data: str) -> str:
+        sha = hashlib.sha256(self._check_fingerprint().encode())
+        sha.update(user_data.encode())
+        return sha.hexdigest()
+
+    def path(self, key: str, extension: str = ".pdf") -> str:
+        return os.path.join(self._fingerprint_dir(), key + extension)
+
+    def get_path(self, key: str, extension: str = ".pdf") -> Optional[str]:
+        """
+        Path of the cached artifact on disk, or None on a miss.
+        """
+        path = self.path(key, extension)
+        if os.path.exists(path):
+            self._count('disk_hits')
+            os.utime(path)  # keeps the disk tier roughly LRU
+            return path
+        self._count('misses')
+        return None
+
+    def put(self, key: str, source: str, extension: str = ".pdf") -> str:
+        """
+        Store the compiled file at `source` and return its path in the cache.
+        """
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = "{}.{}.part".format(path, threading.get_ident())
+        shutil.copyfile(source, partial)
+        size = os.path.getsize(partial)
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(partial, path)
+            self.counters['stores'] += 1
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+            else:
+                self._disk_bytes += size - replaced
+            if self._disk_bytes > self.max_bytes:
+                self._evict_disk()
+        return path
+
+    def invalidate(self):
+        with self._lock:
+            if os.path.isdir(self.directory):
+                shutil.rmtree(self.directory, ignore_errors=True)
+            self._disk_bytes = 0
+            self.counters['invalidations'] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        stats['disk_bytes'] = sum(size for _, _, size in self._disk_entries())
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _fingerprint_dir(self):
+        return os.path.join(self.directory, self._check_fingerprint()[:16])
+
+    def _check_fingerprint(self):
+        digest = self.fingerprint.digest
+        with self._lock:
+            if digest != self._current_fingerprint:
+                if self._current_fingerprint is not None:
+                    logger.info("templates changed, invalidating pdf cache")
+                    self.invalidate()
+                self._current_fingerprint = digest
+        return digest
+
+    def _disk_entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(EXTENSIONS):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, os.path.join(root, name), st.st_size))
+        return entries
+
+    def _evict_disk(self):
+        """
+        Remove the least recently used files until the cache is below
+        EVICT_TO of `max_bytes`. Called with the lock held.
+        """
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, _, size in entries)
+        if total <= self.max_bytes:
+            self._disk_bytes = total
+            return
+        for _, path, size in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.counters['disk_evictions'] += 1
+        self._disk_bytes = total
+
+
+_artifact_cache = None
+_artifact_cache_lock = threading.Lock()
+
+
+def artifact_cache() -> ArtifactCache:
+    global _artifact_cache
+    with _artifact_cache_lock:
+        if _artifact_cache is None:
+            _artifact_cache = ArtifactCache(
+                settings.PDF_CACHE_DIR,
+                settings.LATEX_SRC_DIR,
+                max_bytes=settings.PDF_CACHE_MAX_BYTES,
+            )
+        return _artifact_cache
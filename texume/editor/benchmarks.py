@@ -0,0 +1,342 @@
+import asyncio
+import contextlib
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import django
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User as AuthUser
+from django.contrib.sessions.models import Session
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client, RequestFactory, override_settings
+
+from editor import models, preview
+from editor.artifacts import ArtifactCache
+from editor.compiler import AsyncCompileEngine, CompileEngine
+from editor.models import Content, Resume, User, latest_content, latest_contents, parse_body
+from editor.workspace import Workspace
+
+FAKE_PDFLATEX = [
+    sys.executable,
+    os.path.join(os.path.dirname(__file__), "testdata", "fake_pdflatex.py"),
+]
+FAKE_PDFTOPPM = [
+    sys.executable,
+    os.path.join(os.path.dirname(__file__), "testdata", "fake_pdftoppm.py"),
+]
+
+class FakeToolchain:
+    """
+    The compile pipeline on the fake pdflatex and pdftoppm from testdata:
+    while entered, editor.models and editor.preview use a Workspace, an
+    ArtifactCache and compile engines in a scratch directory, removed on
+    exit. Used by the benchmarks and the tests.
+    """
+
+    def __init__(self, workers: int = 1, queue_size: int = 8,
+                 concurrency: int = 8, async_queue_size: int = 32):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.async_queue_size = async_queue_size
+        self._stack = None
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp()
+        self._stack = contextlib.ExitStack()
+        self._stack.callback(shutil.rmtree, self.directory)
+        self.workspace = Workspace(self.directory, os.path.join(self.directory, "scratch"))
+        self.cache = ArtifactCache(os.path.join(self.directory, "cache"), self.directory)
+        self.engine = CompileEngine(FAKE_PDFLATEX, workers=self.workers, queue_size=self.queue_size)
+        self.async_engine = AsyncCompileEngine(
+            FAKE_PDFLATEX, concurrency=self.concurrency, queue_size=self.async_queue_size
+        )
+        for module in (models, preview):
+            self._stack.enter_context(mock.patch.object(module, 'workspace', return_value=self.workspace))
+            self._stack.enter_context(mock.patch.object(module, 'artifact_cache', return_value=self.cache))
+            self._stack.enter_context(mock.patch.object(module, 'compile_engine', return_value=self.engine))
+        self._stack.enter_context(
+            mock.patch.object(models, 'async_compile_engine', return_value=self.async_engine)
+        )
+        self._stack.enter_context(
+            override_settings(LATEX_USE_FORMAT=False, PREVIEW_RASTERIZE_COMMAND=FAKE_PDFTOPPM)
+        )
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+
+SECTION_FORMATTING = {
+    Content.Section.EDUCATION: Content.Formatting.ORG_LOC_TITLE_DATE_POINTS,
+    Content.Section.PROFESSIONAL_EXPERIANCE: Content.Formatting.ORG_LOC_TITLE_DATE_POINTS,
+    Content.Section.PROJECT_WORK: Content.Formatting.DATE_POINTS,
+    Content.Section.PUBLICATIONS: Content.Formatting.DATE_POINTS,
+}
+
+
+def synthetic_body(formatting: str, entries: int, items: int, revision: int = 0) -> str:
+    if formatting == Content.Formatting.ORG_LOC_TITLE_DATE_POINTS:
+        return "\n\n".join(
+            "\n".join(
+                ["organisation {}".format(i), "city {}".format(i), "title {} rev {}".format(i, revision),
+                 "20{:02d}-01-01".format(i % 100)] +
+                ["did thing {} at organisation {}".format(j, i) for j in range(items)]
+            )
+            for i in range(entries)
+        )
+    elif formatting == Content.Formatting.DATE_POINTS:
+        return "\n\n".join(
+            "\n".join(
+                ["20{:02d}-01-01".format(i % 100)] +
+                ["point {} of {} rev {}".format(j, i, revision) for j in range(items)]
+            )
+            for i in range(entries)
+        )
+    return ", ".join("skill {} rev {}".format(i, revision) for i in range(entries * items))
+
+
+def synthetic_user(name: str, entries: int = 5, items: int = 4, history: int = 1) -> User:
+    """
+    A profile with every section filled in, each edited `history` times.
+    """
+    auth_user = AuthUser.objects.create_user(username=name)
+    profile = User.objects.create(user=auth_user)
+    rows = []
+    for section in Resume.SECTION_CHOICES:
+        formatting = SECTION_FORMATTING.get(section, Content.Formatting.TEXT)
+        for revision in range(history):
+            if section in Resume.HEADER_SECTIONS:
+                body = "{} {} rev {}".format(section, name, revision)
+            else:
+                body = synthetic_body(formatting, entries, items, revision)
+            rows.append(Content(
+                user=profile, section=section, formatting=formatting, body=body,
+                parsed=parse_body(formatting, body),
+            ))
+    Content.objects.bulk_create(rows)
+    return profile
+
+
+def measure(function, number: int, setup=None) -> dict:
+    """
+    Timings of `number` calls to `function`, `setup` (untimed) running
+    before each of them.
+    """
+    timings = []
+    for _ in range(number):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return {
+        'number': number,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'max': max(timings),
+    }
+
+
+def run_suite(entries: int = 5, items: int = 4, history: int = 1, number: int = 20) -> dict:
+    """
+    Time the render and compile pipeline for one synthetic user. Creates
+    rows, so callers run it inside a transaction they roll back.
+    """
+    profile = synthetic_user("benchmark-user", entries, items, history)
+    auth_user = profile.user
+    results = {}
+
+    results['latest_content'] = measure(
+        lambda: [latest_content(auth_user, s) for s in Resume.SECTION_CHOICES], number
+    )
+    results['latest_contents'] = measure(lambda: latest_contents(auth_user), number)
+    # the plain entries render every fragment, the _cached ones read them
+    # from the fragment cache filled by the previous calls
+    clear_fragments = models.fragment_cache().clear
+    for file_format in models.ALLOWED_FILE_FORMATS:
+        results['resume_render_{}'.format(file_format)] = measure(
+            lambda: Resume(auth_user).render(file_format), number, setup=clear_fragments
+        )
+        results['resume_render_{}_cached'.format(file_format)] = measure(
+            lambda: Resume(auth_user).render(file_format), number
+        )
+
+    contents = latest_contents(auth_user)
+    for formatting in Content.Formatting:
+        content = next(
+            c for c in contents.values()
+            if c.formatting == formatting and c.section not in Resume.HEADER_SECTIONS
+        )
+        for file_format in models.ALLOWED_FILE_FORMATS:
+            name = 'content_render_{}_{}'.format(formatting.value, file_format)
+            results[name] = measure(lambda: content._render(file_format), number)
+            results[name + '_cached'] = measure(lambda: content.render(file_format), number)
+
+    with FakeToolchain() as toolchain:
+        def compile_cold():
+            toolchain.cache.invalidate()
+            Resume(auth_user).save_latex()
+        results['save_latex_cold'] = measure(compile_cold, number)
+        results['save_latex_cached'] = measure(lambda: Resume(auth_user).save_latex(), number)
+
+        section = contents[Content.Section.PROFESSIONAL_EXPERIANCE]
+        def preview_cold():
+            toolchain.cache.invalidate()
+            preview.compile_preview(section)
+        results['preview_cold'] = measure(preview_cold, number)
+        results['preview_cached'] = measure(lambda: preview.compile_preview(section), number)
+
+    return {
+        'meta': {
+            'entries': entries,
+            'items': items,
+            'history': history,
+            'number': number,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'timestamp': time.time(),
+        },
+        'results': results,
+    }
+
+
+def regressions(current: dict, baseline: dict, tolerance: float = 0.2) -> dict:
+    """
+    Benchmarks whose median got slower than the baseline by more than
+    `tolerance` (a fraction), with their slowdown ratio.
+    """
+    slower = {}
+    for name, timing in current['results'].items():
+        previous = baseline['results'].get(name)
+        if previous and previous['median'] > 0:
+            ratio = timing['median'] / previous['median']
+            if ratio > 1 + tolerance:
+                slower[name] = ratio
+    return slower
+
+
+def _latencies(timings: list, wall_time: float) -> dict:
+    return {
+        'requests': len(timings),
+        'wall_time': wall_time,
+        'throughput': len(timings) / wall_time,
+        'median': statistics.median(timings),
+        'max': max(timings),
+    }
+
+
+def _wsgi_get(handler: WSGIHandler, path: str, cookie: str) -> int:
+    environ = RequestFactory().get(path, HTTP_COOKIE=cookie).environ
+    status = []
+    response = handler(environ, lambda code, headers: status.append(int(code.split()[0])))
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return status[0]
+
+
+async def _asgi_get(handler: ASGIHandler, path: str, cookie: str) -> int:
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': b"", 'root_path': "",
+        'headers': [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        'client': ("127.0.0.1", 0), 'server': ("testserver", 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b"", 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await handler(scope, receive, send)
+    return messages[0]['status']
+
+
+def load_test(requests: int = 32, threads: int = 4, in_flight: int = 32, sleep: float = 0.2) -> dict:
+    """
+    Request `requests` different resumes at once through the server
+    handlers, middleware included, with a fake pdflatex taking `sleep`
+    seconds a pass: /generate/ through the WSGI handler on `threads`
+    threads, /generate/async/ through the ASGI handler on one event loop
+    keeping up to `in_flight` compiles going. Creates (and commits) a user
+    per request and deletes them afterwards.
+    """
+    profiles = [
+        synthetic_user("load-test-{}".format(i), entries=1, items=1) for i in range(requests)
+    ]
+    sessions = []
+    try:
+        for profile in profiles:
+            client = Client()
+            client.force_login(profile.user)
+            sessions.append(client.session.session_key)
+        cookies = ["{}={}".format(settings.SESSION_COOKIE_NAME, key) for key in sessions]
+        toolchain = FakeToolchain(
+            workers=threads, queue_size=requests * 2, concurrency=in_flight, async_queue_size=requests
+        )
+        with toolchain, override_settings(ALLOWED_HOSTS=["testserver"]), \
+                mock.patch.dict(os.environ, {"FAKE_PDFLATEX_SLEEP": str(sleep)}):
+            wsgi_handler = WSGIHandler()
+            asgi_handler = ASGIHandler()
+
+            # latencies count from the start of the burst, queueing included
+            def request(i):
+                status = _wsgi_get(wsgi_handler, "/editor/generate/", cookies[i])
+                if status != 200:
+                    raise RuntimeError("WSGI request {} answered {}".format(i, status))
+                return time.perf_counter() - started
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                timings = list(pool.map(request, range(requests)))
+            wsgi = _latencies(timings, time.perf_counter() - started)
+
+            # the compiled pdfs are cached now, start the ASGI run cold
+            toolchain.cache.invalidate()
+
+            async def request_async(i):
+                status = await _asgi_get(asgi_handler, "/editor/generate/async/", cookies[i])
+                if status != 200:
+                    raise RuntimeError("ASGI request {} answered {}".format(i, status))
+                return time.perf_counter() - started
+
+            async def run_all():
+                return await asyncio.gather(*[request_async(i) for i in range(requests)])
+
+            started = time.perf_counter()
+            # async_to_sync runs the views' database access on this thread
+            timings = async_to_sync(run_all)()
+            asgi = _latencies(timings, time.perf_counter() - started)
+    finally:
+        Session.objects.filter(session_key__in=sessions).delete()
+        AuthUser.objects.filter(id__in=[profile.user_id for profile in profiles]).delete()
+
+    return {
+        'meta': {
+            'requests': requests,
+            'threads': threads,
+            'in_flight': in_flight,
+            'sleep': sleep,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'timestamp': time.time(),
+        },
+        'wsgi': wsgi,
+        'asgi': asgi,
+    }
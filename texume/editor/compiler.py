@@ -0,0 +1,352 @@
+import asyncio
+import collections
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import List, NamedTuple, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CompilerBusy(Exception):
+    """
+    Raised when the compile queue is full; callers should retry later.
+    """
+
+
+class RunResult(NamedTuple):
+    return_code: Optional[int]  # None when killed at the deadline
+    wall_time: float  # seconds
+    cpu_time: float  # user + system seconds
+    max_rss: int  # peak resident set size, kilobytes
+    timed_out: bool
+
+
+class CompileResult(NamedTuple):
+    return_code: Optional[int]  # None when the compile timed out
+    wait_time: float  # seconds spent queued
+    run_time: float  # seconds spent in pdflatex
+    cpu_time: float = 0.0
+    max_rss: int = 0
+    timed_out: bool = False
+
+    @property
+    def ok(self):
+        return self.return_code == 0
+
+
+# prlimit (util-linux) sets the limits and execs the command, so nothing
+# runs between fork and exec in the threaded parent (no preexec_fn)
+PRLIMIT = "prlimit"
+RLIMITS = {
+    'cpu': "--cpu",  # seconds
+    'memory': "--as",  # bytes of address space
+    'output': "--fsize",  # bytes per written file
+    'files': "--nofile",  # open file descriptors
+}
+
+
+def _limited(args: List[str], limits: Optional[dict]) -> List[str]:
+    if not limits:
+        return args
+    options = ["{}={}".format(RLIMITS[name], value) for name, value in limits.items()]
+    return [PRLIMIT] + options + ["--"] + args
+
+
+def _kill_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_supervised(args: List[str], cwd: str, env: Optional[dict] = None,
+                   timeout: float = 10.0, limits: Optional[dict] = None) -> RunResult:
+    """
+    Run a command in its own process group under resource limits. The
+    whole group is killed once `timeout` seconds pass; waiting blocks on
+    the child's exit instead of polling.
+    """
+    started = time.monotonic()
+    p = subprocess.Popen(
+        _limited(args, limits), cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    timed_out = threading.Event()
+    finished = threading.Lock()
+
+    def deadline():
+        with finished:
+            if p.returncode is None:
+                timed_out.set()
+                _kill_group(p.pid)
+
+    timer = threading.Timer(timeout, deadline)
+    timer.daemon = True
+    timer.start()
+    _, status, rusage = os.wait4(p.pid, 0)
+    with finished:
+        timer.cancel()
+        if os.WIFSIGNALED(status):
+            p.returncode = -os.WTERMSIG(status)
+        else:
+            p.returncode = os.WEXITSTATUS(status)
+    _kill_group(p.pid)  # anything the compile left running in the background
+
+    return RunResult(
+        return_code=None if timed_out.is_set() else p.returncode,
+        wall_time=time.monotonic() - started,
+        cpu_time=rusage.ru_utime + rusage.ru_stime,
+        max_rss=rusage.ru_maxrss,
+        timed_out=timed_out.is_set(),
+    )
+
+
+async def run_supervised_async(args: List[str], cwd: str, env: Optional[dict] = None,
+                               timeout: float = 10.0, limits: Optional[dict] = None) -> RunResult:
+    """
+    run_supervised for an event loop: awaits the child instead of blocking a
+    thread on it. The loop reaps the child, so its cpu time and peak rss are
+    not reported.
+    """
+    started = time.monotonic()
+    p = await asyncio.create_subprocess_exec(
+        *_limited(args, limits), cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    timed_out = False
+    try:
+        await asyncio.wait_for(p.wait(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        _kill_group(p.pid)
+        await p.wait()
+    finally:
+        if p.returncode is None:  # cancelled
+            _kill_group(p.pid)
+    _kill_group(p.pid)  # anything the compile left running in the background
+
+    return RunResult(
+        return_code=None if timed_out else p.returncode,
+        wall_time=time.monotonic() - started,
+        cpu_time=0.0,
+        max_rss=0,
+        timed_out=timed_out,
+    )
+
+
+class _CompileJob(NamedTuple):
+    args: List[str]
+    cwd: str
+    env: Optional[dict]
+    submitted: float
+    future: Future
+
+
+class CompileEngine:
+    """
+    Fixed number of worker threads, each running at most one pdflatex
+    process, fed from a bounded queue. Submitting to a full queue raises
+    CompilerBusy instead of forking yet another TeX process.
+    """
+
+    def __init__(self, command: List[str], workers: int = 2,
+                 queue_size: int = 8, timeout: float = 10.0,
+                 limits: Optional[dict] = None):
+        self.command = list(command)
+        self.workers = workers
+        self.timeout = timeout
+        self.limits = dict(limits or {})
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._wait_times = collections.deque(maxlen=256)
+        self.counters = collections.Counter()
+        self._threads = [
+            threading.Thread(target=self._work, name="compile-{}".format(i), daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, cwd: str, args: List[str], env: Optional[dict] = None) -> Future:
+        future = Future()
+        job = _CompileJob(self.command + list(args), cwd, env, time.monotonic(), future)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count('rejected')
+            raise CompilerBusy("{} compiles queued".format(self._queue.qsize()))
+        self._count('submitted')
+        return future
+
+    def compile(self, cwd: str, args: List[str], env: Optional[dict] = None) -> CompileResult:
+        return self.submit(cwd, args, env).result()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            wait_times = list(self._wait_times)
+            running = self._running
+            stats = dict(self.counters)
+        stats.update({
+            'workers': self.workers,
+            'running': running,
+            'queue_depth': self.queue_depth,
+            'queue_size': self._queue.maxsize,
+            'mean_wait_time': sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            'max_wait_time': max(wait_times, default=0.0),
+        })
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            wait_time = started - job.submitted
+            with self._lock:
+                self._running += 1
+                self._wait_times.append(wait_time)
+            try:
+                run = self._run(job)
+                result = CompileResult(
+                    run.return_code, wait_time, run.wall_time,
+                    run.cpu_time, run.max_rss, run.timed_out,
+                )
+                self._count('succeeded' if result.ok else 'failed')
+                job.future.set_result(result)
+            except Exception as e:
+                self._count('failed')
+                job.future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _run(self, job: _CompileJob) -> RunResult:
+        logger.info("compiling {} in {}".format(job.args, job.cwd))
+        run = run_supervised(
+            job.args, job.cwd, env=job.env, timeout=self.timeout, limits=self.limits
+        )
+        if run.timed_out:
+            self._count('timeouts')
+        return run
+
+
+class AsyncCompileEngine:
+    """
+    CompileEngine for async callers: at most `concurrency` pdflatex
+    processes per event loop, awaited rather than each holding a thread,
+    and CompilerBusy once `queue_size` compiles wait for a slot.
+    """
+
+    def __init__(self, command: List[str], concurrency: int = 8,
+                 queue_size: int = 32, timeout: float = 10.0,
+                 limits: Optional[dict] = None):
+        self.command = list(command)
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.limits = dict(limits or {})
+        self._semaphores = weakref.WeakKeyDictionary()  # event loop -> Semaphore
+        self._waiting = 0
+        self._running = 0
+        self.counters = collections.Counter()
+
+    async def compile(self, cwd: str, args: List[str], env: Optional[dict] = None) -> CompileResult:
+        if self._waiting >= self.queue_size:
+            self.counters['rejected'] += 1
+            raise CompilerBusy("{} compiles queued".format(self._waiting))
+        self.counters['submitted'] += 1
+        submitted = time.monotonic()
+        self._waiting += 1
+        try:
+            await self._semaphore().acquire()
+        finally:
+            self._waiting -= 1
+        wait_time = time.monotonic() - submitted
+        self._running += 1
+        try:
+            logger.info("compiling {} in {}".format(args, cwd))
+            run = await run_supervised_async(
+                self.command + list(args), cwd, env=env, timeout=self.timeout, limits=self.limits
+            )
+        except Exception:
+            self.counters['failed'] += 1
+            raise
+        finally:
+            self._running -= 1
+            self._semaphore().release()
+        if run.timed_out:
+            self.counters['timeouts'] += 1
+        result = CompileResult(
+            run.return_code, wait_time, run.wall_time, run.cpu_time, run.max_rss, run.timed_out
+        )
+        self.counters['succeeded' if result.ok else 'failed'] += 1
+        return result
+
+    def stats(self) -> dict:
+        stats = dict(self.counters)
+        stats.update({
+            'concurrency': self.concurrency,
+            'running': self._running,
+            'queue_depth': self._waiting,
+            'queue_size': self.queue_size,
+        })
+        return stats
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_async_engine = None
+
+
+def compile_engine() -> CompileEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CompileEngine(
+                settings.PDFLATEX_COMMAND,
+                workers=settings.COMPILE_WORKERS,
+                queue_size=settings.COMPILE_QUEUE_SIZE,
+                timeout=settings.COMPILE_TIMEOUT,
+                limits=settings.COMPILE_LIMITS,
+            )
+        return _engine
+
+
+def async_compile_engine() -> AsyncCompileEngine:
+    global _async_engine
+    with _engine_lock:
+        if _async_engine is None:
+            _async_engine = AsyncCompileEngine(
+                settings.PDFLATEX_COMMAND,
+                concurrency=settings.ASYNC_COMPILE_CONCURRENCY,
+                queue_size=settings.ASYNC_COMPILE_QUEUE_SIZE,
+                timeout=settings.COMPILE_TIMEOUT,
+                limits=settings.COMPILE_LIMITS,
+            )
+        return _async_engine
@@ -0,0 +1,97 @@
+"""
+Serving compiled PDFs from the artifact cache.
+
+With PDF_OFFLOAD set, the response only names the file and the front-end
+server sends it (and handles ranges) through X-Accel-Redirect (nginx) or
+X-Sendfile (Apache, lighttpd), so no worker is held while it downloads.
+Otherwise the file is streamed by Django: whole files through FileResponse,
+which WSGI servers send with sendfile, single byte ranges in chunks.
+"""
+import os
+import re
+from typing import Optional
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+from editor.artifacts import artifact_cache
+
+RANGE = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+UNSATISFIABLE = object()
+
+
+def pdf_response(request, path: str, etag: Optional[str] = None,
+                 content_type: str = 'application/pdf') -> HttpResponse:
+    """
+    Response serving the cached PDF (or preview image) at `path`. Raises
+    FileNotFoundError when it is gone.
+    """
+    if settings.PDF_OFFLOAD and not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if settings.PDF_OFFLOAD == "x-accel-redirect":
+        relative = os.path.relpath(path, artifact_cache().directory)
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.PDF_OFFLOAD_PREFIX.rstrip("/") + "/" + relative
+        return response
+    if settings.PDF_OFFLOAD == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    file = open(path, 'rb')
+    size = os.fstat(file.fileno()).st_size
+    byte_range = None
+    if etag is None or request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is UNSATISFIABLE:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = "bytes */{}".format(size)
+    elif byte_range is not None:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(file, start, end), status=206, content_type=content_type
+        )
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = "bytes {}-{}/{}".format(start, end, size)
+    else:
+        response = FileResponse(file, content_type=content_type)
+    response['Accept-Ranges'] = "bytes"
+    return response
+
+
+def parse_range(header: Optional[str], size: int):
+    """
+    (first, last) byte of a single "bytes=" range, UNSATISFIABLE if it lies
+    past the end, or None to send the whole file (no or unsupported Range).
+    """
+    match = RANGE.match(header or "")
+    if not match or not (match.group('start') or match.group('end')):
+        return None
+    start, end = match.group('start'), match.group('end')
+    if not start:  # the last `end` bytes
+        length = int(end)
+        if length == 0:
+            return UNSATISFIABLE
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        return UNSATISFIABLE
+    if end < start:
+        return None
+    return start, end
+
+
+def _read_range(file, start: int, end: int):
+    with file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
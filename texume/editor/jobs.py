@@ -0,0 +1,128 @@
+import datetime as dt
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from editor.compiler import CompilerBusy
+from editor.models import CompileError, GenerateJob, Resume, User
+
+logger = logging.getLogger(__name__)
+
+
+def submit(user: User) -> GenerateJob:
+    job = GenerateJob.objects.create(user=user)
+    if settings.JOB_WORKER_AUTOSTART:
+        job_worker().wake()
+    return job
+
+
+def autostart():
+    """
+    Start the worker with the server, so jobs queued before a restart run
+    without waiting for the next submit.
+    """
+    if settings.JOB_WORKER_AUTOSTART:
+        job_worker().wake()
+
+
+def requeue_stale(now: dt.datetime = None) -> int:
+    """
+    Queue again the running jobs whose lease ran out, their worker died.
+    """
+    now = now or timezone.now()
+    stale = (
+        GenerateJob.objects
+            .filter(status=GenerateJob.Status.RUNNING)
+            .filter(claimed__lt=now - dt.timedelta(seconds=settings.JOB_LEASE))
+            .update(status=GenerateJob.Status.QUEUED, claimed=None)
+        )
+    if stale:
+        logger.warning("requeued {} stale generate jobs".format(stale))
+    return stale
+
+
+def run_next() -> bool:
+    """
+    Claim the oldest queued job and run it. Returns False when nothing is
+    queued or the compiler is too busy to take more work.
+    """
+    requeue_stale()
+    job = (
+        GenerateJob.objects
+            .filter(status=GenerateJob.Status.QUEUED)
+            .order_by('created', 'id')
+            .select_related('user__user')
+            .first()
+        )
+    if job is None:
+        return False
+    claimed = (
+        GenerateJob.objects
+            .filter(id=job.id, status=GenerateJob.Status.QUEUED)
+            .update(status=GenerateJob.Status.RUNNING, claimed=timezone.now())
+        )
+    if not claimed:  # another worker got there first
+        return True
+
+    try:
+        artifact = Resume(job.user.user, profile=job.user).save_latex()
+    except CompilerBusy:
+        GenerateJob.objects.filter(id=job.id).update(status=GenerateJob.Status.QUEUED, claimed=None)
+        return False
+    except CompileError as e:
+        job.status, job.error = GenerateJob.Status.FAILED, str(e)
+    except Exception as e:
+        logger.exception("generate job {} crashed".format(job.id))
+        job.status, job.error = GenerateJob.Status.FAILED, repr(e)
+    else:
+        job.status, job.artifact = GenerateJob.Status.DONE, artifact
+    job.save(update_fields=['status', 'artifact', 'error', 'updated'])
+    return True
+
+
+def run_pending():
+    while run_next():
+        pass
+
+
+class JobWorker(threading.Thread):
+    """
+    In-process worker draining the GenerateJob table; drains it once on
+    start, then is woken on submit and polls every JOB_POLL_INTERVAL
+    seconds for jobs queued elsewhere.
+    """
+
+    def __init__(self, poll_interval: float):
+        super().__init__(name="generate-jobs", daemon=True)
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._wakeup.set()  # pick up what was queued before the start
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                run_pending()
+            except Exception:
+                logger.exception("generate job worker failed")
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def job_worker() -> JobWorker:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = JobWorker(settings.JOB_POLL_INTERVAL)
+            _worker.start()
+        return _worker
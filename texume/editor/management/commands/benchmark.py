@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from editor.benchmarks import regressions, run_suite
+
+
+class Command(BaseCommand):
+    help = (
+        "Time latest_content, Resume.render, Content.render and save_latex (with a fake "
+        "pdflatex) for a synthetic user and write the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=5, help="entries per section")
+        parser.add_argument('--items', type=int, default=4, help="points per entry")
+        parser.add_argument('--history', type=int, default=1, help="revisions per section")
+        parser.add_argument('--number', type=int, default=20, help="timed runs per benchmark")
+        parser.add_argument('--output', help="write JSON here instead of stdout")
+        parser.add_argument('--baseline', help="JSON of a previous run to compare against")
+        parser.add_argument('--tolerance', type=float, default=0.2)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            report = run_suite(
+                entries=options['entries'], items=options['items'],
+                history=options['history'], number=options['number'],
+            )
+            transaction.set_rollback(True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        else:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                slower = regressions(report, json.load(f), options['tolerance'])
+            for name, ratio in sorted(slower.items()):
+                self.stderr.write("{}: {:.2f}x slower than baseline".format(name, ratio))
+            if slower:
+                raise CommandError("{} benchmarks regressed".format(len(slower)))
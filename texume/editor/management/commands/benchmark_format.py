@@ -0,0 +1,60 @@
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from editor.models import TexFormats
+from editor.texformat import PreambleFormat
+
+
+class Command(BaseCommand):
+    help = "Compare per-compile pdflatex latency with and without the preamble format"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        work_dir = tempfile.mkdtemp()
+        try:
+            src_dir = os.path.join(work_dir, "src")
+            shutil.copytree(settings.LATEX_SRC_DIR, src_dir)
+            with open(os.path.join(src_dir, "user-data.tex"), "w") as f:
+                f.write(TexFormats.format_header())
+
+            fmt = PreambleFormat(
+                src_dir, os.path.join(work_dir, "formats"),
+                command=settings.PDFLATEX_COMMAND,
+            )
+            started = time.perf_counter()
+            fmt_path = fmt.ensure()
+            build_time = time.perf_counter() - started
+            if fmt_path is None:
+                self.stderr.write("could not build the preamble format")
+                return
+            self.stdout.write("format build: {:.3f}s".format(build_time))
+
+            for label, extra_args in [("plain", []), ("format", ["-fmt={}".format(fmt_path)])]:
+                timings = [
+                    self._compile(src_dir, extra_args) for _ in range(options['runs'])
+                ]
+                self.stdout.write("{:>6}: median {:.3f}s mean {:.3f}s min {:.3f}s".format(
+                    label, statistics.median(timings), statistics.mean(timings), min(timings)
+                ))
+        finally:
+            shutil.rmtree(work_dir)
+
+    def _compile(self, src_dir, extra_args):
+        command = settings.PDFLATEX_COMMAND + extra_args + [
+            "-interaction=batchmode", "user-resume.tex"
+        ]
+        started = time.perf_counter()
+        subprocess.run(
+            command, cwd=src_dir, stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+        )
+        return time.perf_counter() - started
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from editor.benchmarks import load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Request many resumes at once (with a fake pdflatex) through the WSGI handler "
+        "and the ASGI handler, middleware included, and compare them, as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=32, help="concurrent requests")
+        parser.add_argument('--threads', type=int, default=4, help="WSGI worker threads")
+        parser.add_argument('--in-flight', type=int, default=32, help="ASGI compiles in flight")
+        parser.add_argument('--sleep', type=float, default=0.2, help="seconds per fake pdflatex pass")
+        parser.add_argument('--output', help="write JSON here instead of stdout")
+
+    def handle(self, *args, **options):
+        report = load_test(
+            requests=options['requests'], threads=options['threads'],
+            in_flight=options['in_flight'], sleep=options['sleep'],
+        )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        else:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
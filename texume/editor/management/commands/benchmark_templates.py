@@ -0,0 +1,84 @@
+import textwrap
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from editor.models import Content, TexFormats
+
+
+def _legacy_format_oltdp(ORG, LOC, TITLE, DATE, ITEMS):
+    """
+    TexFormats.format_oltdp before templates were compiled, kept as the
+    baseline for this benchmark.
+    """
+    tex_template = r"""
+    \OrgLocTitleDate{ORG}{LOC}{TITLE}{DATE}\begin{list2}
+        \item {ITEM}
+    \end{list2}
+    """
+    start, sep, end = textwrap.dedent(tex_template).strip().split("\n")
+    rendered_output = [start]
+    for point in ITEMS:
+        rendered_output.append(sep.replace('ITEM', point))
+    rendered_output.append(end)
+    rendered_output = "\n".join(rendered_output)
+    rendered_output = rendered_output.replace('ORG', ORG)
+    rendered_output = rendered_output.replace('LOC', LOC)
+    rendered_output = rendered_output.replace('TITLE', TITLE)
+    rendered_output = rendered_output.replace('DATE', DATE)
+    return rendered_output
+
+
+def _legacy_render_section(section, **kwargs):
+    tex_template = textwrap.dedent(r"""
+    \renewcommand{\SECTION}{
+        BODY
+    }
+    """).strip() + "\n\n"
+    section = TexFormats.SECTION_COMMANDS[section]
+    subsections_keys = list(kwargs.keys())
+    num_subsections = len(kwargs[subsections_keys[0]])
+    body = []
+    for i in range(num_subsections):
+        subsection_kwargs = {k: kwargs[k][i] for k in subsections_keys}
+        body.append(_legacy_format_oltdp(**subsection_kwargs))
+    body = "\n".join(body)
+    return tex_template.replace('SECTION', section).replace('BODY', body)
+
+
+class Command(BaseCommand):
+    help = "Time TexFormats.render_section against the pre-compiled-template implementation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=50)
+        parser.add_argument('--items', type=int, default=20)
+        parser.add_argument('--number', type=int, default=200)
+
+    def handle(self, *args, **options):
+        entries, items = options['entries'], options['items']
+        section_kwargs = {
+            'ORG': ["organisation {}".format(i) for i in range(entries)],
+            'LOC': ["location {}".format(i) for i in range(entries)],
+            'TITLE': ["title {}".format(i) for i in range(entries)],
+            'DATE': ["2019-01-{:02d}".format(i % 28 + 1) for i in range(entries)],
+            'ITEMS': [
+                ["did thing {} of {} with some words around it".format(j, i) for j in range(items)]
+                for i in range(entries)
+            ],
+        }
+        section = Content.Section.PROFESSIONAL_EXPERIANCE
+        formatting = Content.Formatting.ORG_LOC_TITLE_DATE_POINTS
+        assert _legacy_render_section(section, **section_kwargs) == \
+            TexFormats.render_section(section, formatting, **section_kwargs)
+
+        number = options['number']
+        legacy = min(timeit.repeat(
+            lambda: _legacy_render_section(section, **section_kwargs), number=number, repeat=3
+        )) / number
+        compiled = min(timeit.repeat(
+            lambda: TexFormats.render_section(section, formatting, **section_kwargs),
+            number=number, repeat=3
+        )) / number
+        self.stdout.write("{} entries x {} items".format(entries, items))
+        self.stdout.write("  legacy:   {:.1f}us".format(legacy * 1e6))
+        self.stdout.write("  compiled: {:.1f}us ({:.2f}x)".format(compiled * 1e6, legacy / compiled))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from editor.retention import RetentionPolicy, compact
+
+
+class Command(BaseCommand):
+    help = "Delete old Content revisions outside the CONTENT_RETENTION policy"
+
+    def add_arguments(self, parser):
+        policy = RetentionPolicy.from_settings()
+        parser.add_argument('--keep-last', type=int, default=policy.keep_last)
+        parser.add_argument('--keep-daily', type=int, default=policy.keep_daily)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help="only report what would be reclaimed")
+
+    def handle(self, *args, **options):
+        if options['keep_last'] < 1:
+            raise CommandError("--keep-last must be at least 1, the latest revision is kept")
+        policy = RetentionPolicy(options['keep_last'], options['keep_daily'])
+        report = compact(policy, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        self.stdout.write("{} {} revisions, {} bytes of body text".format(
+            "would delete" if options['dry_run'] else "deleted",
+            report['rows'], report['body_bytes'],
+        ))
@@ -0,0 +1,136 @@
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from editor.artifacts import artifact_cache
+from editor.models import CompileError, Resume, User, compile_fragments, latest_contents_by_user
+from editor.texformat import preamble_format
+
+
+def _compile(user_id, key, fragments):
+    """
+    Runs in a worker process; returns plain data so nothing has to be
+    unpickled back into model or exception instances.
+    """
+    started = time.perf_counter()
+    try:
+        compile_fragments(user_id, key, fragments)
+        error = None
+    except CompileError as e:
+        error = str(e)
+    except Exception as e:
+        error = repr(e)
+    return {'user': user_id, 'ok': error is None, 'error': error,
+            'time': time.perf_counter() - started}
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild every user's resume pdf, e.g. after changing resume.cls or macros.tex. "
+        "Interrupted runs resume from the checkpoint file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--checkpoint', default='regenerate_all.checkpoint')
+        parser.add_argument('--summary', help="write a JSON summary of failures and timings here")
+        parser.add_argument('--restart', action='store_true', help="ignore the checkpoint file")
+        parser.add_argument('--force', action='store_true', help="recompile cached resumes too")
+
+    def handle(self, *args, **options):
+        done = set() if options['restart'] else self._read_checkpoint(options['checkpoint'])
+        profiles = User.objects.exclude(user_id__in=done).select_related('user').order_by('id')
+        total = profiles.count()
+        results = []
+        started = time.perf_counter()
+        self.stdout.write("regenerating {} resumes ({} already done) with {} workers".format(
+            total, len(done), options['workers']))
+
+        if settings.LATEX_USE_FORMAT:
+            preamble_format().ensure()  # once here rather than racing in every worker
+        # the workers never touch the database, don't hand them our connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=multiprocessing.get_context('fork')
+        )
+        with open(options['checkpoint'], 'w' if options['restart'] else 'a') as checkpoint, pool:
+            for batch in self._batches(profiles, options['batch_size']):
+                futures = []
+                by_user = latest_contents_by_user(batch)
+                for profile in batch:
+                    resume = Resume(profile.user, latest=by_user[profile.id])
+                    fragments = resume._render_fragments("latex")
+                    key = artifact_cache().key("".join(text for _, text in fragments))
+                    if not options['force'] and artifact_cache().get_path(key):
+                        result = {'user': profile.user_id, 'ok': True, 'error': None,
+                                  'time': 0.0, 'cached': True}
+                        self._record(checkpoint, results, result, total)
+                        continue
+                    futures.append(pool.submit(_compile, profile.user_id, key, fragments))
+                for future in as_completed(futures):
+                    self._record(checkpoint, results, future.result(), total)
+
+        summary = self._summary(results, time.perf_counter() - started)
+        self.stdout.write(json.dumps(summary, indent=2))
+        if options['summary']:
+            with open(options['summary'], 'w') as f:
+                json.dump(summary, f, indent=2)
+
+    def _batches(self, profiles, batch_size):
+        last_id = 0
+        while True:
+            batch = list(profiles.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].id
+
+    def _record(self, checkpoint, results, result, total):
+        results.append(result)
+        checkpoint.write(json.dumps(result) + "\n")
+        checkpoint.flush()
+        self.stdout.write("[{}/{}] user {} {} {:.2f}s{}".format(
+            len(results), total, result['user'],
+            "cached" if result.get('cached') else "ok" if result['ok'] else "FAILED",
+            result['time'], "" if result['ok'] else ": " + result['error'],
+        ))
+
+    def _read_checkpoint(self, path):
+        done = set()
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:  # torn last line of an interrupted run
+                        continue
+                    if result['ok']:
+                        done.add(result['user'])
+        except FileNotFoundError:
+            pass
+        return done
+
+    def _summary(self, results, elapsed):
+        timings = [r['time'] for r in results if not r.get('cached')]
+        return {
+            'users': len(results),
+            'compiled': len(timings),
+            'cached': sum(1 for r in results if r.get('cached')),
+            'failed': sum(1 for r in results if not r['ok']),
+            'failures': {r['user']: r['error'] for r in results if not r['ok']},
+            'elapsed': elapsed,
+            'compile_time': {
+                'total': sum(timings),
+                'mean': statistics.mean(timings) if timings else 0.0,
+                'median': statistics.median(timings) if timings else 0.0,
+                'max': max(timings, default=0.0),
+            },
+        }
@@ -0,0 +1,146 @@
+"""
+Process-local timings and counters for the resume pipeline.
+
+Code wraps its hot paths in `stage("name")`; every stage is rolled up into
+a histogram, exposed with the counters as Prometheus text by the metrics
+view, and the stages of the current request are sent back as a
+Server-Timing header by editor.middleware.ServerTimingMiddleware.
+"""
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# seconds, upper bounds of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+COUNTERS = {
+    'compiles': "Resume compiles started.",
+    'compile_failures': "Resume compiles that failed, timeouts included.",
+    'compile_timeouts': "Resume compiles killed at the deadline.",
+    'precompiles': "Speculative compiles after content saves.",
+}
+
+PREFIX = "texume"
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        total, counts = 0, []
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}  # name -> Histogram
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def exposition(self) -> str:
+        """
+        Everything recorded so far in the Prometheus text format.
+        """
+        lines = []
+        with self._lock:
+            name = PREFIX + "_stage_seconds"
+            lines.append("# HELP {} Time spent in each stage of serving a resume.".format(name))
+            lines.append("# TYPE {} histogram".format(name))
+            for stage, histogram in sorted(self.stages.items()):
+                bounds = ["{:g}".format(b) for b in histogram.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.cumulative()):
+                    lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(name, stage, bound, count))
+                lines.append('{}_sum{{stage="{}"}} {:.6f}'.format(name, stage, histogram.sum))
+                lines.append('{}_count{{stage="{}"}} {}'.format(name, stage, histogram.count))
+            for counter, value in self.counters.items():
+                name = "{}_{}_total".format(PREFIX, counter)
+                lines.append("# HELP {} {}".format(name, COUNTERS[counter]))
+                lines.append("# TYPE {} counter".format(name))
+                lines.append("{} {}".format(name, value))
+        return "\n".join(lines) + "\n"
+
+
+_registry = Registry()
+
+# (stage, seconds) recorded while serving the current request, None outside one
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def registry() -> Registry:
+    return _registry
+
+
+def inc(counter: str, amount: int = 1):
+    _registry.inc(counter, amount)
+
+
+def record(name: str, seconds: float):
+    _registry.observe(name, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def start_request():
+    """
+    Collect the stages run from here on; returns the token for end_request.
+    """
+    return _request_timings.set([])
+
+
+def end_request(token) -> List[Tuple[str, float]]:
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing(timings: List[Tuple[str, float]]) -> Optional[str]:
+    """
+    Server-Timing header value, repeated stages (e.g. pdflatex passes)
+    summed into one entry.
+    """
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    if not totals:
+        return None
+    return ", ".join(
+        "{};dur={:.1f}".format(name, seconds * 1000) for name, seconds in totals.items()
+    )
@@ -0,0 +1,216 @@
+import asyncio
+import collections
+import contextvars
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from editor import metrics
+from editor.models import profile_for
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCapableMiddleware:
+    """
+    Middleware for both sync and async chains, the way Django's
+    MiddlewareMixin does it: under ASGI get_response is a coroutine function
+    and __call__ returns acall's coroutine, so requests to async views never
+    wait on the single thread sync middleware would run them in.
+
+    Subclasses define call(request) and the coroutine acall(request).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        return self.call(request)
+
+
+class ServerTimingMiddleware(AsyncCapableMiddleware):
+    """
+    Sends the stages timed while handling a request back as a Server-Timing
+    header. Goes first in MIDDLEWARE so "total" covers the other middleware.
+    """
+
+    def call(self, request):
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self._timed_response(response, timings, time.perf_counter() - started)
+
+    async def acall(self, request):
+        token = metrics.start_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self._timed_response(response, timings, time.perf_counter() - started)
+
+    def _timed_response(self, response, timings, total):
+        metrics.registry().observe("total", total)
+        timings.append(("total", total))
+        header = metrics.server_timing(timings)
+        if header:
+            response['Server-Timing'] = header
+        if response.streaming and getattr(response, 'file_to_stream', None) is None:
+            # headers are gone by the time the body streams, so this one
+            # only reaches the histograms
+            response.streaming_content = _timed(response.streaming_content)
+        return response
+
+
+def _timed(content):
+    started = time.perf_counter()
+    try:
+        yield from content
+    finally:
+        metrics.registry().observe("stream", time.perf_counter() - started)
+
+
+class ProfileMiddleware(AsyncCapableMiddleware):
+    """
+    Sets request.profile to the editor profile of request.user (falsy when
+    there is none), looked up at most once per request and only if used.
+    Goes after AuthenticationMiddleware.
+    """
+
+    def call(self, request):
+        request.profile = SimpleLazyObject(lambda: profile_for(request.user))
+        return self.get_response(request)
+
+    async def acall(self, request):
+        request.profile = SimpleLazyObject(lambda: profile_for(request.user))
+        return await self.get_response(request)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    A view ran more SQL queries than its query_budget allows.
+    """
+
+
+def query_budget(queries: int):
+    """
+    Declare the most SQL queries a view may run per request, middleware and
+    session/auth lookups included. Checked by QueryBudgetMiddleware.
+    """
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+class QueryRecorder:
+
+    def __init__(self):
+        self.queries = collections.Counter()  # sql -> times run
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - started
+            self.queries[sql] += 1
+
+    @property
+    def count(self):
+        return sum(self.queries.values())
+
+    def repeated(self, threshold: int):
+        """
+        Queries run `threshold` or more times, the same SQL with different
+        parameters being the mark of a query issued in a loop.
+        """
+        return {sql: n for sql, n in self.queries.items() if n >= threshold}
+
+
+# recorder of the request being handled; async views run their queries in
+# sync_to_async threads, which get a copy of the request's context
+_query_recorder = contextvars.ContextVar("query_recorder", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    recorder = _query_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _watch_queries():
+    """
+    Route the queries of this thread's connection to the current recorder.
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class QueryBudgetMiddleware(AsyncCapableMiddleware):
+    """
+    Development and test aid: counts and times the SQL of each request,
+    warns about repeated queries and about views over their query_budget,
+    and raises QueryBudgetExceeded instead when QUERY_BUDGET_STRICT is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def call(self, request):
+        recorder = QueryRecorder()
+        request.query_budget = None
+        _watch_queries()
+        token = _query_recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_recorder.reset(token)
+        return self._check(request, recorder, response)
+
+    async def acall(self, request):
+        recorder = QueryRecorder()
+        request.query_budget = None
+        await sync_to_async(_watch_queries)()
+        token = _query_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_recorder.reset(token)
+        return self._check(request, recorder, response)
+
+    def _check(self, request, recorder, response):
+        metrics.record("sql", recorder.time)
+        response['X-Query-Count'] = str(recorder.count)
+
+        for sql, n in recorder.repeated(settings.QUERY_REPEAT_THRESHOLD).items():
+            logger.warning("{} ran the same query {} times: {}".format(request.path, n, sql))
+        if request.query_budget is not None and recorder.count > request.query_budget:
+            message = "{} ran {} queries, its budget is {}".format(
+                request.path, recorder.count, request.query_budget
+            )
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
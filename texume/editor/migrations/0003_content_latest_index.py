@@ -0,0 +1,17 @@
+# Generated by Django 3.0.3 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0002_auto_20200210_0210'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['user', 'section', 'created'], name='editor_content_latest_idx'),
+        ),
+    ]
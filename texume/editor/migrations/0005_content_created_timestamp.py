@@ -0,0 +1,30 @@
+# Generated by Django 3.0.3 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+def dates_to_timestamps(apps, schema_editor):
+    # sqlite keeps the old 'YYYY-MM-DD' text, which reads back as None from a
+    # DateTimeField; other backends convert the column in the ALTER itself
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    table = schema_editor.quote_name(apps.get_model('editor', 'Content')._meta.db_table)
+    schema_editor.execute(
+        "UPDATE {} SET created = created || ' 00:00:00' WHERE length(created) = 10".format(table)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0004_generatejob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='content',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.RunPython(dates_to_timestamps, migrations.RunPython.noop),
+    ]
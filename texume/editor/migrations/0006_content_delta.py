@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0005_content_created_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='delta',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
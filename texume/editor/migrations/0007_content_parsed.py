@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+# a copy of editor.models.parse_body as of this migration
+FIELDS = {
+    'org-loc-title-date-points': ['org', 'loc', 'title', 'date', 'items'],
+    'date-points': ['date', 'points'],
+}
+
+
+def parse_body(formatting, body):
+    fields = FIELDS[formatting]
+    entries = []
+    for item in body.replace("\r\n", "\n").split("\n\n"):
+        lines = item.split("\n", len(fields) - 1)
+        if len(lines) < len(fields):
+            raise ValueError(item)
+        entry = dict(zip(fields, lines))
+        entry[fields[-1]] = lines[-1].split("\n")
+        entries.append(entry)
+    return entries
+
+
+def parse_bodies(apps, schema_editor):
+    Content = apps.get_model('editor', 'Content')
+    # delta revisions have no body to parse, they are parsed if ever rendered
+    contents = Content.objects.filter(delta="", formatting__in=list(FIELDS))
+    for content in contents.iterator():
+        try:
+            parsed = parse_body(content.formatting, content.body)
+        except ValueError:
+            continue  # left to fail at render time, as before
+        Content.objects.filter(id=content.id).update(parsed=parsed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0006_content_delta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='parsed',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(parse_bodies, migrations.RunPython.noop),
+    ]
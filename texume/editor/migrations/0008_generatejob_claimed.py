@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('editor', '0007_content_parsed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatejob',
+            name='claimed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,25 +1,45 @@
 import logging
 import datetime as dt
+import hashlib
 import textwrap
 import os
 import re
-from typing import List
-import shutil
-import tempfile
-import subprocess
-import time
+from typing import List, Optional
 
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.contrib.auth.models import User as AuthUser
+
+from editor.artifacts import artifact_cache
+from editor import metrics, texlog
+from editor.compiler import async_compile_engine, compile_engine
+from editor.texformat import preamble_format
+from editor.workspace import AuxState, workspace
 # Create your models here.
 
-MIN_DATE = dt.date(year=2000, month=1, day=1)
+MIN_DATE = dt.datetime(year=2000, month=1, day=1, tzinfo=dt.timezone.utc)
 ALLOWED_FILE_FORMATS = ["markdown", "latex"]
-LATEX_DIR = "./wd/"  # assume this directory exists
+# never wait on TeX's error prompt, stop at the first error and report it as file:line
+COMPILE_FLAGS = ["-interaction=nonstopmode", "-halt-on-error", "-file-line-error"]
+
+# bump whenever rendering output changes, so cached fragments are not reused
+RENDERER_VERSION = 1
 
 logger = logging.getLogger(__name__)
 
+
+def fragment_cache():
+    return caches[settings.FRAGMENT_CACHE]
+
+
+def fragment_key(content_id: int, file_format: str) -> str:
+    return "fragment:{}:{}:{}".format(content_id, file_format, RENDERER_VERSION)
+
 class User(models.Model):
     user = models.OneToOneField(AuthUser, on_delete=models.CASCADE)
 
@@ -46,6 +66,13 @@ class Content(models.Model):
 
     body = models.TextField()
 
+    # older revisions store a delta against the next revision instead of
+    # their body, see editor.revisions
+    delta = models.TextField(blank=True, default="")
+
+    # the body split into entries at save time, see parse_body
+    parsed = models.JSONField(null=True, blank=True, editable=False)
+
     class Formatting(models.TextChoices):
         ORG_LOC_TITLE_DATE_POINTS = "org-loc-title-date-points"
         DATE_POINTS = "date-points"
@@ -57,53 +84,107 @@ class Content(models.Model):
         default=Formatting.TEXT
     )
 
-    created = models.DateField(auto_now_add=True)
+    created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # serves the "latest row per (user, section)" lookups
+            models.Index(
+                fields=['user', 'section', 'created'],
+                name='editor_content_latest_idx',
+            ),
+        ]
+
+    def clean(self):
+        try:
+            self.parsed = parse_body(self.formatting, self.body)
+        except ValueError as e:
+            raise ValidationError({'body': str(e)})
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            # rows are meant to be append-only, but admin edits must not
+            # leave stale fragments behind
+            fragment_cache().delete_many(
+                [fragment_key(self.pk, f) for f in ALLOWED_FILE_FORMATS]
+            )
+            if not self.delta:
+                self.parsed = parse_body(self.formatting, self.body)
+            super().save(*args, **kwargs)
+        else:
+            if self.parsed is None:  # not cleaned by a form
+                self.parsed = parse_body(self.formatting, self.body)
+            super().save(*args, **kwargs)
+            from editor import revisions  # imports this module
+            revisions.store_revision(self)
 
     def render(self, file_format):
+        """
+        Rendered fragment for this row, memoized per (id, format) since a
+        saved row never changes.
+        """
         if file_format not in ALLOWED_FILE_FORMATS:
             raise ValueError(f"{file_format} can be one of {ALLOWED_FILE_FORMATS}")
+        if self.pk is None:
+            return self._render(file_format)
+        key = fragment_key(self.pk, file_format)
+        fragment = fragment_cache().get(key)
+        if fragment is None:
+            fragment = self._render(file_format)
+            fragment_cache().set(key, fragment, None)
+        return fragment
+
+    def full_body(self) -> str:
+        """
+        The body, rebuilt for revisions stored as deltas (whose `body` is
+        empty); what every render path reads.
+        """
+        if not self.delta:
+            return self.body
+        from editor import revisions  # imports this module
+        return revisions.revision_body(self)
+    full_body.short_description = "body"
 
-        if self.formatting == Content.Formatting.ORG_LOC_TITLE_DATE_POINTS:
-            _list = _two_line_split(self.body)
-            section_kwargs = {
-                'ORG': [], 'LOC': [], 'TITLE': [], 'DATE': [], 'ITEMS': []
-            }
-            for item in _list:
-                org, loc, title, date, description = item.split("\n", 4)
-                section_kwargs['ORG'].append(org)
-                section_kwargs['LOC'].append(loc)
-                section_kwargs['TITLE'].append(title)
-                section_kwargs['DATE'].append(date)
-                section_kwargs['ITEMS'].append(description.split("\n"))
+    def entries(self):
+        """
+        The parsed body, parsing it here for rows that were never saved and
+        for revisions stored as deltas.
+        """
+        if self.parsed is None:
+            self.parsed = parse_body(self.formatting, self.full_body())
+        return self.parsed
 
+    def _render(self, file_format):
+        if self.formatting == Content.Formatting.ORG_LOC_TITLE_DATE_POINTS:
+            entries = self.entries()
             if file_format == "latex":
                 rendered_output = TexFormats.render_section(
-                    self.section, self.formatting, **section_kwargs
+                    self.section, self.formatting,
+                    ORG=[entry['org'] for entry in entries],
+                    LOC=[entry['loc'] for entry in entries],
+                    TITLE=[entry['title'] for entry in entries],
+                    DATE=[entry['date'] for entry in entries],
+                    ITEMS=[entry['items'] for entry in entries],
                 )
                 return rendered_output
             else: # file_format == "markdown":
                 rendered_output = [self.section]
 
-                for i in range(len(_list)):
-                    org = section_kwargs['ORG'][i]
-                    loc = section_kwargs['LOC'][i]
-                    title = section_kwargs['TITLE'][i]
-                    date = section_kwargs['DATE'][i]
-                    body = [("* " + item) for item in section_kwargs['ITEMS'][i]]
+                for entry in entries:
+                    body = [("* " + item) for item in entry['items']]
                     body = "\n".join(body)
                     rendered_output.append(textwrap.dedent(f"""
-                        *{org}* {loc}
-                        _{title}_ [{date}]
+                        *{entry['org']}* {entry['loc']}
+                        _{entry['title']}_ [{entry['date']}]
                     """) + "\n" + body)
 
                 return "\n\n".join(rendered_output) + "\n\n"
 
         elif self.formatting == Content.Formatting.DATE_POINTS:
-            _list = _two_line_split(self.body)
+            entries = self.entries()
 
             if file_format == "latex":
-                date_points = [item.split("\n", 1) for item in _list]
+                date_points = [[entry['date'], "\n".join(entry['points'])] for entry in entries]
                 rendered_output = TexFormats.render_section(
                     self.section,
                     self.formatting,
@@ -112,22 +193,80 @@ class Content(models.Model):
                 return rendered_output
             else:  # file_format == "markdown":
                 rendered_output = [self.section]
-                for item in _list:
-                    date, description = item.split("\n", 1)
-                    rendered_description = "; ".join(description.split("\n"))
-                    rendered_output.append(f"* [{date}] {rendered_description}")
+                for entry in entries:
+                    rendered_description = "; ".join(entry['points'])
+                    rendered_output.append(f"* [{entry['date']}] {rendered_description}")
                 return "\n".join(rendered_output) + "\n"
         else:
             if file_format == "latex":
                 rendered_output = TexFormats.render_section(
-                    self.section, self.formatting, BODY=self.body
+                    self.section, self.formatting, BODY=self.full_body()
                 )
                 return rendered_output
             else:
-                return f"{self.section}\n{self.body}\n"
-
-        self.formatting
-    
+                return f"{self.section}\n{self.full_body()}\n"
+
+
+def parse_body(formatting: str, body: str) -> Optional[list]:
+    """
+    Entries of a body written in `formatting`, separated by blank lines:
+    {org, loc, title, date, items} for org-loc-title-date-points, {date,
+    points} for date-points, None for plain text. Raises ValueError naming
+    the first malformed entry.
+    """
+    if formatting == Content.Formatting.ORG_LOC_TITLE_DATE_POINTS:
+        fields, minimum = ['org', 'loc', 'title', 'date', 'items'], 5
+    elif formatting == Content.Formatting.DATE_POINTS:
+        fields, minimum = ['date', 'points'], 2
+    else:
+        return None
+    entries = []
+    for number, item in enumerate(_two_line_split(body), 1):
+        lines = item.split("\n", minimum - 1)
+        if len(lines) < minimum:
+            raise ValueError(
+                "entry {} needs {} lines ({}), found {}".format(
+                    number, minimum, ", ".join(fields[:-1] + ["one per point"]), len(lines)
+                )
+            )
+        entry = dict(zip(fields, lines))
+        entry[fields[-1]] = lines[-1].split("\n")
+        entries.append(entry)
+    return entries
+
+
+class TexTemplate:
+    """
+    A template parsed once into literal text and placeholder segments, so
+    rendering is one pass that never re-scans substituted values (a user
+    writing "DATE" in their text keeps it).
+    """
+
+    def __init__(self, template: str, placeholders: List[str]):
+        pattern = re.compile("|".join(re.escape(p) for p in placeholders))
+        self.segments = []  # (is_placeholder, text)
+        position = 0
+        for match in pattern.finditer(template):
+            self.segments.append((False, template[position:match.start()]))
+            self.segments.append((True, match.group()))
+            position = match.end()
+        self.segments.append((False, template[position:]))
+
+    def fill_into(self, output: List[str], values: dict):
+        for is_placeholder, text in self.segments:
+            output.append(values.get(text, text) if is_placeholder else text)
+
+    def fill(self, **values) -> str:
+        output = []
+        self.fill_into(output, values)
+        return "".join(output)
+
+
+def _template_lines(tex_template: str, placeholders: List[str]):
+    return [
+        TexTemplate(line, placeholders)
+        for line in textwrap.dedent(tex_template).strip().split("\n")
+    ]
 
 
 class TexFormats:
@@ -142,12 +281,47 @@ class TexFormats:
         Content.Section.EXTRA_CURRICULAR : "extraCurricular",
     }
 
-    def render_section(section: str, formatting: str, **kwargs):
-        tex_template = textwrap.dedent(r"""
+    SECTION_COMMANDS_REVERSE = {
+        command: section for section, command in SECTION_COMMANDS.items()
+    }
+
+    SECTION_TEMPLATE = TexTemplate(textwrap.dedent(r"""
         \renewcommand{\SECTION}{
             BODY
         }
-        """).strip() + "\n\n"
+        """).strip() + "\n\n", ["SECTION", "BODY"])
+
+    OLTDP_START, OLTDP_ITEM, OLTDP_END = _template_lines(r"""
+        \OrgLocTitleDate{ORG}{LOC}{TITLE}{DATE}\begin{list2}
+            \item {ITEM}
+        \end{list2}
+        """, ["ORG", "LOC", "TITLE", "DATE", "ITEM"])
+
+    DATEPOINTS_START, DATEPOINTS_ITEM, DATEPOINTS_END = _template_lines(r"""
+            \vspace{0mm}\begin{itemize}[leftmargin=0pt,label={}]
+                \item \DatePoint{POINT}{DATE}
+            \end{itemize}
+        """, ["POINT", "DATE"])
+
+    HEADER_TEMPLATE = TexTemplate(textwrap.dedent(r"""
+            \newcommand{\phone}{PHONE}
+            \newcommand{\postmail}{POSTMAIL}
+            \newcommand{\email}{EMAIL}
+            \newcommand{\homepage}{\href{LINK}{LINK}}
+            \name{\href{LINK}{\Large{NAME}}}
+            \address{\phone\\\postmail}
+            \address{\hfill\email\\\hfill\homepage}
+        """).strip() + "\n\n", ["NAME", "PHONE", "POSTMAIL", "EMAIL", "LINK"])
+
+    HEADER_WORDS = {
+        "NAME": Content.Section.NAME,
+        "PHONE": Content.Section.PHONE,
+        "POSTMAIL": Content.Section.POSTMAIL,
+        "EMAIL": Content.Section.EMAIL,
+        "LINK": Content.Section.LINK,
+    }
+
+    def render_section(section: str, formatting: str, **kwargs):
         section = TexFormats.SECTION_COMMANDS[section]
         if formatting == Content.Formatting.ORG_LOC_TITLE_DATE_POINTS:
             subsections_keys = list(kwargs.keys())
@@ -157,84 +331,62 @@ class TexFormats:
                 subsection_kwargs = {k: kwargs[k][i] for k in subsections_keys}
                 body.append(TexFormats.format_oltdp(**subsection_kwargs))
             body = "\n".join(body)
-            return tex_template.replace('SECTION', section).replace('BODY', body)
         elif formatting == Content.Formatting.DATE_POINTS:
             body = TexFormats.format_datepoints(**kwargs)
-            return tex_template.replace('SECTION', section).replace('BODY', body)
         else:
             body = TexFormats.format_body(**kwargs)
-            return tex_template.replace('SECTION', section).replace('BODY', body)
+        return TexFormats.SECTION_TEMPLATE.fill(SECTION=section, BODY=body)
 
     @staticmethod
     def format_oltdp(ORG: str, LOC: str, TITLE: str, DATE: str, ITEMS: List[str]):
-        tex_template = r"""
-        \OrgLocTitleDate{ORG}{LOC}{TITLE}{DATE}\begin{list2}
-            \item {ITEM}
-        \end{list2}
-        """
-        start, sep, end = textwrap.dedent(tex_template).strip().split("\n")
-        rendered_output = [start]
+        values = {'ORG': ORG, 'LOC': LOC, 'TITLE': TITLE, 'DATE': DATE}
+        rendered_output = []
+        TexFormats.OLTDP_START.fill_into(rendered_output, values)
         for point in ITEMS:
-            rendered_output.append(sep.replace('ITEM', point))
-        rendered_output.append(end)
-        rendered_output = "\n".join(rendered_output)
-        rendered_output = rendered_output.replace('ORG', ORG)
-        rendered_output = rendered_output.replace('LOC', LOC)
-        rendered_output = rendered_output.replace('TITLE', TITLE)
-        rendered_output = rendered_output.replace('DATE', DATE)
-        return rendered_output
+            rendered_output.append("\n")
+            TexFormats.OLTDP_ITEM.fill_into(rendered_output, {'ITEM': point})
+        rendered_output.append("\n")
+        TexFormats.OLTDP_END.fill_into(rendered_output, values)
+        return "".join(rendered_output)
 
     @staticmethod
     def format_datepoints(DATE_POINTS: List[List[str]]):
-        tex_template = r"""
-            \vspace{0mm}\begin{itemize}[leftmargin=0pt,label={}]
-                \item \DatePoint{POINT}{DATE}
-            \end{itemize}
-        """
-        start, sep, end = textwrap.dedent(tex_template).strip().split("\n")
-        rendered_output = [start]
+        rendered_output = []
+        TexFormats.DATEPOINTS_START.fill_into(rendered_output, {})
         for date, point in DATE_POINTS:
-            rendered_output.append(sep.replace('DATE', date).replace('POINT', point))
-        rendered_output.append(end)
-        rendered_output = "\n".join(rendered_output)
-        return rendered_output
+            rendered_output.append("\n")
+            TexFormats.DATEPOINTS_ITEM.fill_into(rendered_output, {'DATE': date, 'POINT': point})
+        rendered_output.append("\n")
+        TexFormats.DATEPOINTS_END.fill_into(rendered_output, {})
+        return "".join(rendered_output)
 
     @staticmethod
     def format_body(BODY: str):
-        return r"{BODY}".replace('BODY', BODY)
+        return "{" + BODY + "}"
 
     @staticmethod
     def format_header(**kwargs):
-        tex_template = r"""
-            \newcommand{\phone}{PHONE}
-            \newcommand{\postmail}{POSTMAIL}
-            \newcommand{\email}{EMAIL}
-            \newcommand{\homepage}{\href{LINK}{LINK}}
-            \name{\href{LINK}{\Large{NAME}}}
-            \address{\phone\\\postmail}
-            \address{\hfill\email\\\hfill\homepage}
-        """
-        tex_template = textwrap.dedent(tex_template).strip() + "\n\n"
-        replace_words = {
-            "NAME": Content.Section.NAME,
-            "PHONE": Content.Section.PHONE,
-            "POSTMAIL": Content.Section.POSTMAIL,
-            "EMAIL": Content.Section.EMAIL,
-            "LINK": Content.Section.LINK,
-        }
-        for word, section in replace_words.items():
-            tex_template = tex_template.replace(word, kwargs.get(section, word))
-
-        return tex_template
+        return TexFormats.HEADER_TEMPLATE.fill(**{
+            word: kwargs.get(section, word)
+            for word, section in TexFormats.HEADER_WORDS.items()
+        })
 
 class Resume:
 
     SECTION_CHOICES = [s for s, _ in Content.Section.choices]
     HEADER_SECTIONS = ["Name", "Link", "Phone", "Email", "Postmail"]
 
-    def __init__(self, user: AuthUser):
+    def __init__(self, user: AuthUser, latest: dict = None, profile: "User" = None):
+        """
+        `latest` optionally preloads the section -> Content mapping, as
+        returned by latest_contents, for callers that fetch in bulk.
+        `profile` is the user's editor profile when the caller has it.
+        """
         self.user = user
+        self.profile = profile
         self._all_latest_content = None
+        if latest is not None:
+            self._fill_latest_content(latest)
 
     def refresh(self):
         self._all_latest_content = None
@@ -253,92 +405,347 @@ class Resume:
                 last_updated = content.created
         return last_updated
 
-    def save_latex(self):
-        temp_dir = tempfile.mkdtemp(dir=LATEX_DIR, prefix="user{}_".format(self.user.id))
-        working_directory = os.path.join(temp_dir, "wd")  # shutil wants to create a new file
-        user_date_filename = os.path.join(working_directory, "user-data.tex")
-        resume_file = os.path.join(working_directory, "user-resume.pdf")
-
-        shutil.copytree("../src/", working_directory)
-        with open(user_date_filename, "w") as file:
-            user_data = self.render("latex")
-            file.write(user_data)
-        command = [
-            "pdflatex",
-            "user-resume.tex"
-        ]
-        print(command)
-        p = subprocess.Popen(command, cwd=working_directory, stdin=subprocess.DEVNULL)
-        TIMEOUT = 10.0 # seconds
-        for _ in range(10):
-            return_code = p.poll()
-            if return_code is None:
-                time.sleep(TIMEOUT/10)
-        print("status:{} return_code:{}".format(
-            "SUCCESS" if return_code == 0 else "FAILURE", return_code
-            ))
-        return resume_file if return_code==0 else None
+    def etag(self, mode: str) -> str:
+        """
+        Strong validator of the output in `mode` ("pdf" or one of
+        ALLOWED_FILE_FORMATS), from the latest content ids, the renderer
+        version and, for pdf, the template fingerprint. Renders nothing.
+        """
+        sha = hashlib.sha256("{}:{}:{}".format(mode, self.user.id, RENDERER_VERSION).encode())
+        for section in self.SECTION_CHOICES:
+            sha.update("{}={};".format(section, self.all_latest_content[section].pk).encode())
+        if mode == "pdf":
+            sha.update(artifact_cache().fingerprint.digest.encode())
+        return '"{}"'.format(sha.hexdigest()[:32])
+
+    def last_modified(self, mode: str) -> float:
+        """
+        Timestamp of the latest change to the output in `mode`: the newest
+        content, or for pdf the template files when they changed later.
+        """
+        last_modified = self.last_updated.timestamp()
+        if mode == "pdf":
+            last_modified = max(last_modified, artifact_cache().fingerprint.mtime or 0)
+        return last_modified
+
+    def save_latex(self) -> str:
+        """
+        Path of the compiled resume, served from the artifact cache when the
+        same data was already compiled against the current templates.
+        Raises CompileError with the pdflatex diagnostics when it fails.
+        """
+        cache = artifact_cache()
+        fragments = self._render_fragments("latex")
+        key = cache.key(_join_fragments(fragments))
+        with metrics.stage("cache"):
+            path = cache.get_path(key)
+        return path or self._compile_latex(key, fragments)
+
+    async def asave_latex(self) -> str:
+        """
+        save_latex for async callers: the database access runs through
+        sync_to_async and the compile is awaited.
+        """
+        fragments = await sync_to_async(self._render_fragments)("latex")
+        cache = artifact_cache()
+        key = cache.key(_join_fragments(fragments))
+        with metrics.stage("cache"):
+            path = cache.get_path(key)
+        return path or await compile_fragments_async(self.user.id, key, fragments)
+
+    def _compile_latex(self, key: str, fragments) -> str:
+        return compile_fragments(self.user.id, key, fragments)
 
     def render(self, file_format):
+        return _join_fragments(self._render_fragments(file_format))
+
+    def _render_fragments(self, file_format):
+        """
+        The rendered resume as (section, text) pieces in document order, the
+        header sections sharing a single "Header" piece.
+        """
         if file_format not in ALLOWED_FILE_FORMATS:
             raise ValueError(f"{file_format} can be one of {ALLOWED_FILE_FORMATS}")
 
+        # fetch outside the render stage, the queries are timed on their own
+        self.all_latest_content
+        with metrics.stage("render"):
+            return self._render_all(file_format)
+
+    def _render_all(self, file_format):
         header_info = {
-            section: self.all_latest_content.get(section).body
+            section: self.all_latest_content.get(section).full_body()
             for section in self.HEADER_SECTIONS
         }
 
         if file_format == "latex":
-            rendered_resume = TexFormats.format_header(**header_info)
+            rendered_header = TexFormats.format_header(**header_info)
         else:
-            rendered_resume = textwrap.dedent("""
+            rendered_header = textwrap.dedent("""
                 *{Name}*
                 {Phone}
                 {Email}
                 {Postmail}
                 {Link}
                 """).format(**header_info)
+        fragments = [("Header", rendered_header)]
 
-
-        for section, content in self.all_latest_content.items():
-            if section not in self.HEADER_SECTIONS:
-                content.body, content.formatting
-                rendered_resume += content.render(file_format)
-
-        return rendered_resume
-    
+        sections = [
+            (section, content) for section, content in self.all_latest_content.items()
+            if section not in self.HEADER_SECTIONS
+        ]
+        keys = {
+            section: fragment_key(content.pk, file_format)
+            for section, content in sections if content.pk is not None
+        }
+        cached = fragment_cache().get_many(keys.values())
+        rendered = {}
+        for section, content in sections:
+            fragment = cached.get(keys.get(section))
+            if fragment is None:
+                fragment = content._render(file_format)
+                if section in keys:
+                    rendered[keys[section]] = fragment
+            fragments.append((section, fragment))
+        if rendered:
+            fragment_cache().set_many(rendered, None)
+
+        return fragments
 
     def _fetch_latest_content(self):
+        self._fill_latest_content(latest_contents(self.user, profile=self.profile))
+
+    def _fill_latest_content(self, found):
         self._all_latest_content = {
-            s: latest_content(self.user, s) for s in self.SECTION_CHOICES
+            s: found.get(s) or Content(section=s) for s in self.SECTION_CHOICES
         }
 
 
-def authuser_is_user(user: AuthUser) -> bool:
-    num_users = len(User.objects.filter(user=user))
-    if num_users == 0:
-        return False
-    else:
-        # num_users == 1
-        return True
+def compile_fragments(user_id: int, key: str, fragments) -> str:
+    """
+    Compile rendered resume fragments into the artifact cache and return the
+    cached path. Needs no database access, so it can run in worker processes.
+    """
+    metrics.inc("compiles")
+    ws = workspace()
+    with ws.scratch(prefix="user{}_".format(user_id)) as working_directory:
+        aux_state = _prepare(ws, user_id, working_directory, fragments)
+        passes = _passes(working_directory, aux_state, preamble_format().compile_args())
+        args = next(passes)
+        while args is not None:
+            result = compile_engine().compile(working_directory, args, env=ws.env())
+            args = passes.send(result)
+        return _finish(key, fragments, working_directory, aux_state, result)
+
+
+async def compile_fragments_async(user_id: int, key: str, fragments) -> str:
+    """
+    compile_fragments for async callers, awaiting each pass on the async
+    compile engine instead of blocking a thread on it.
+    """
+    metrics.inc("compiles")
+    ws = workspace()
+    with ws.scratch(prefix="user{}_".format(user_id)) as working_directory:
+        aux_state = _prepare(ws, user_id, working_directory, fragments)
+        # checks the template files on disk
+        format_args = await sync_to_async(preamble_format().compile_args, thread_sensitive=False)()
+        passes = _passes(working_directory, aux_state, format_args)
+        args = next(passes)
+        while args is not None:
+            result = await async_compile_engine().compile(working_directory, args, env=ws.env())
+            args = passes.send(result)
+        # copies the pdf into the cache, off the event loop
+        return await sync_to_async(_finish, thread_sensitive=False)(
+            key, fragments, working_directory, aux_state, result
+        )
 
 
-def latest_content(user: AuthUser, section: str) -> Content:
-    user = User.objects.get(user=user)
-    content = (
-        Content.objects
-            .filter(user=user)
-            .filter(section__exact=section)
-        )
+def _prepare(ws, user_id, working_directory, fragments) -> AuxState:
+    with metrics.stage("workspace"):
+        with open(os.path.join(working_directory, "user-data.tex"), "w") as file:
+            file.write(_join_fragments(fragments))
+        return ws.aux_state(user_id)
+
+
+def _finish(key, fragments, working_directory, aux_state, result) -> str:
+    if result.ok:
+        with metrics.stage("store"):
+            aux_state.save(working_directory)
+            return artifact_cache().put(key, os.path.join(working_directory, "user-resume.pdf"))
+
+    metrics.inc("compile_failures")
+    if result.timed_out:
+        metrics.inc("compile_timeouts")
+    source_map = texlog.SourceMap(fragments, TexFormats.SECTION_COMMANDS_REVERSE)
+    diagnostics = [
+        source_map.locate(diagnostic)
+        for diagnostic in texlog.read_log(os.path.join(working_directory, "user-resume.log"))
+    ]
+    raise CompileError(result, diagnostics)
+
+
+def _passes(working_directory, aux_state, format_args):
+    """
+    Plan as few pdflatex passes as settle the cross-references: start
+    from the user's previous aux state and rerun only while the aux
+    files change (or TeX asks for it). Without a previous state the
+    first pass runs in draft mode, which skips writing the pdf.
+
+    Yields the arguments of each pass and is sent its result; yields None
+    once done, the last result being the outcome.
+    """
+    log_file = os.path.join(working_directory, "user-resume.log")
+    draft = (
+        not aux_state.restore(working_directory)
+        and settings.LATEX_DRAFT_PASS and settings.LATEX_MAX_PASSES > 1
+    )
+    before = AuxState.digest(working_directory)
+    base_args = format_args + COMPILE_FLAGS
+    for passes in range(1, settings.LATEX_MAX_PASSES + 1):
+        args = base_args + (["-draftmode"] if draft else []) + ["user-resume.tex"]
+        result = yield args
+        metrics.record("compile_queue", result.wait_time)
+        metrics.record("pdflatex", result.run_time)
+        logger.info("pass:{}{} status:{} return_code:{} wait:{:.3f}s run:{:.3f}s cpu:{:.3f}s rss:{}kB".format(
+            passes, " (draft)" if draft else "",
+            "SUCCESS" if result.ok else "FAILURE", result.return_code,
+            result.wait_time, result.run_time, result.cpu_time, result.max_rss,
+            ))
+        if not result.ok:
+            break
+        after = AuxState.digest(working_directory)
+        settled = after == before and not texlog.needs_rerun(log_file)
+        if not draft and settled:
+            break
+        draft, before = False, after
+    yield None
+
+
+def _join_fragments(fragments):
+    return "".join(text for _, text in fragments)
+
+
+class CompileError(Exception):
+    """
+    pdflatex failed or timed out; `diagnostics` holds the errors from its
+    log mapped back to resume sections.
+    """
+
+    def __init__(self, result, diagnostics):
+        self.result = result
+        self.diagnostics = diagnostics
+        if result.timed_out:
+            message = "pdflatex timed out after {:.1f}s".format(result.run_time)
+        else:
+            message = "pdflatex failed with return code {}".format(result.return_code)
+        super().__init__("; ".join([message] + [str(d) for d in diagnostics]))
+
+
+class GenerateJob(models.Model):
+    """
+    A queued request to compile a user's resume, run by editor.jobs.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.QUEUED
+    )
+
+    artifact = models.CharField(max_length=512, blank=True)
+
+    error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    updated = models.DateTimeField(auto_now=True)
+
+    # when a worker took the job; running jobs older than JOB_LEASE are
+    # assumed to belong to a dead worker and queued again
+    claimed = models.DateTimeField(null=True, blank=True)
+
+
+def profile_for(user: AuthUser) -> Optional[User]:
+    """
+    The editor profile of an auth user, None for anonymous users and users
+    without one. See editor.middleware.ProfileMiddleware.
+    """
+    if not user.is_authenticated:
+        return None
+    return User.objects.filter(user=user).first()
+
+
+def latest_content(user: AuthUser, section: str, profile: User = None) -> Content:
+    """
+    `profile`, when given, saves looking up the profile of `user`.
+    """
+    with metrics.stage("latest_content"):
+        user = profile or User.objects.get(user=user)
+        content = (
+            Content.objects
+                .filter(user=user)
+                .filter(section__exact=section)
+                .order_by('-created', '-id')
+                .first()
+            )
     logger.info("latest section found for user ({}, {}, {}, {})".format(
-        content.exists(), user, type(user), section
+        content is not None, user, type(user), section
         ))
-    if content.exists():
-        return content.latest('created')
+    if content is not None:
+        return content
     else:
         return Content(user=user, section=section)
 
 
+def latest_contents(user: AuthUser, profile: User = None) -> dict:
+    """
+    Latest Content of every section for the user, fetched in a single query.
+    Sections the user never filled in are absent from the returned dict.
+    """
+    newest = (
+        Content.objects
+            .filter(user=OuterRef('user'), section=OuterRef('section'))
+            .order_by('-created', '-id')
+            .values('id')[:1]
+        )
+    if profile is not None:
+        contents = Content.objects.filter(user=profile)
+    else:
+        contents = Content.objects.filter(user__user=user)
+    contents = contents.filter(id=Subquery(newest))
+    with metrics.stage("latest_content"):
+        return {content.section: content for content in contents}
+
+
+def latest_contents_by_user(users) -> dict:
+    """
+    latest_contents for many profiles in a single query, keyed by profile id.
+    """
+    newest = (
+        Content.objects
+            .filter(user=OuterRef('user'), section=OuterRef('section'))
+            .order_by('-created', '-id')
+            .values('id')[:1]
+        )
+    contents = (
+        Content.objects
+            .filter(user__in=users)
+            .filter(id=Subquery(newest))
+        )
+    by_user = {user.id: {} for user in users}
+    for content in contents:
+        by_user[content.user_id][content.section] = content
+    return by_user
+
+
 from model_mommy import mommy
 from django.test import TestCase
 
@@ -0,0 +1,107 @@
+"""
+Speculative compiles: saving a section usually comes right before a
+Generate, so once a user's edits go quiet their resume is compiled in the
+background and the next /generate/ is an artifact cache hit.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from editor import metrics
+from editor.compiler import CompilerBusy, compile_engine
+from editor.models import CompileError, Content, Resume, User
+
+logger = logging.getLogger(__name__)
+
+
+def precompile(user_id: int) -> bool:
+    """
+    Compile the profile's resume into the artifact cache, returns whether it
+    is there now. Failures are left for the real generate to report.
+    """
+    profile = User.objects.select_related('user').filter(id=user_id).first()
+    if profile is None:
+        return False
+    metrics.inc("precompiles")
+    try:
+        Resume(profile.user, profile=profile).save_latex()
+    except (CompileError, CompilerBusy) as e:
+        logger.info("precompile for user {} skipped: {}".format(user_id, e))
+        return False
+    return True
+
+
+class Precompiler(threading.Thread):
+    """
+    Debounces saves per user: a compile runs `delay` seconds after the last
+    save of a burst, or `max_delay` seconds after its first one, and yields
+    to compiles already queued for requests.
+    """
+
+    def __init__(self, delay: float, max_delay: float):
+        super().__init__(name="precompile", daemon=True)
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending = {}  # user id -> (first save, deadline)
+        self._condition = threading.Condition()
+
+    def schedule(self, user_id: int, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            first, _ = self._pending.get(user_id, (now, None))
+            self._pending[user_id] = (first, min(now + self.delay, first + self.max_delay))
+            self._condition.notify()
+
+    def pop_due(self, now: float = None) -> list:
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            due = [user_id for user_id, (_, deadline) in self._pending.items() if deadline <= now]
+            for user_id in due:
+                del self._pending[user_id]
+            return due
+
+    def run(self):
+        while True:
+            with self._condition:
+                while True:
+                    due = self.pop_due()
+                    if due:
+                        break
+                    deadlines = [deadline for _, deadline in self._pending.values()]
+                    self._condition.wait(
+                        max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+                    )
+            close_old_connections()
+            for user_id in due:
+                if compile_engine().queue_depth > 0:
+                    self.schedule(user_id)  # requests come first
+                    continue
+                try:
+                    precompile(user_id)
+                except Exception:
+                    logger.exception("precompile for user {} failed".format(user_id))
+
+
+_precompiler = None
+_precompiler_lock = threading.Lock()
+
+
+def precompiler() -> Precompiler:
+    global _precompiler
+    with _precompiler_lock:
+        if _precompiler is None:
+            _precompiler = Precompiler(settings.PRECOMPILE_DELAY, settings.PRECOMPILE_MAX_DELAY)
+            _precompiler.start()
+        return _precompiler
+
+
+@receiver(post_save, sender=Content, dispatch_uid="editor.precompile")
+def content_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and settings.PRECOMPILE_ENABLED:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: precompiler().schedule(user_id))
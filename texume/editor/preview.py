@@ -0,0 +1,105 @@
+"""
+Single-section previews. One Content is rendered into preview-data.tex for
+src/section-preview.tex, which has the resume preamble (so it compiles from
+the same preamble format) but typesets only that section: a single pass, no
+aux state and a fraction of the document. The pdf, and optionally a png
+rasterized from it, are kept in the artifact cache keyed by what was
+rendered.
+"""
+import os
+import textwrap
+
+from django.conf import settings
+
+from editor import metrics, texlog
+from editor.artifacts import artifact_cache
+from editor.compiler import compile_engine, run_supervised
+from editor.models import COMPILE_FLAGS, CompileError, Content, TexFormats, TexTemplate
+from editor.texformat import preamble_format
+from editor.workspace import workspace
+
+PREVIEW_TEMPLATE = TexTemplate(textwrap.dedent(r"""
+    \newcommand{\previewTitle}{TITLE}
+    \newcommand{\previewSection}{\COMMAND}
+    """).lstrip(), ["TITLE", "COMMAND"])
+
+PREVIEW_FORMATS = {
+    'pdf': ('.pdf', 'application/pdf'),
+    'png': ('.png', 'image/png'),
+}
+
+
+class PreviewError(Exception):
+    """
+    The preview compiled but could not be rasterized.
+    """
+
+
+def can_preview(section: str) -> bool:
+    # header sections have no \section of their own
+    return section in TexFormats.SECTION_COMMANDS
+
+
+def preview_data(content: Content) -> str:
+    return content.render("latex") + PREVIEW_TEMPLATE.fill(
+        TITLE=content.section, COMMAND=TexFormats.SECTION_COMMANDS[content.section]
+    )
+
+
+def preview_key(content: Content) -> str:
+    return artifact_cache().key("preview\0" + preview_data(content))
+
+
+def compile_preview(content: Content, image_format: str = 'pdf') -> str:
+    """
+    Path of the cached preview of `content` in `image_format`, compiling
+    and rasterizing it first on a miss. Raises CompileError like a full
+    compile, PreviewError when rasterizing fails.
+    """
+    extension, _ = PREVIEW_FORMATS[image_format]
+    cache = artifact_cache()
+    data = preview_data(content)
+    key = cache.key("preview\0" + data)
+    with metrics.stage("cache"):
+        path = cache.get_path(key, extension)
+    if path:
+        return path
+
+    ws = workspace()
+    with ws.scratch(prefix="preview_") as working_directory:
+        pdf = cache.get_path(key) or _compile(key, content.section, data, working_directory, ws.env())
+        if image_format == 'pdf':
+            return pdf
+        return _rasterize(key, pdf, working_directory, extension)
+
+
+def _compile(key, section, data, working_directory, env) -> str:
+    with open(os.path.join(working_directory, "preview-data.tex"), "w") as file:
+        file.write(data)
+    args = preamble_format().compile_args() + COMPILE_FLAGS + ["section-preview.tex"]
+    result = compile_engine().compile(working_directory, args, env=env)
+    metrics.record("compile_queue", result.wait_time)
+    metrics.record("pdflatex", result.run_time)
+    if result.ok:
+        return artifact_cache().put(key, os.path.join(working_directory, "section-preview.pdf"))
+
+    source_map = texlog.SourceMap(
+        [(section, data)], TexFormats.SECTION_COMMANDS_REVERSE, data_file="preview-data.tex"
+    )
+    diagnostics = [
+        source_map.locate(diagnostic)
+        for diagnostic in texlog.read_log(os.path.join(working_directory, "section-preview.log"))
+    ]
+    raise CompileError(result, diagnostics)
+
+
+def _rasterize(key, pdf, working_directory, extension) -> str:
+    prefix = os.path.join(working_directory, "thumbnail")
+    with metrics.stage("rasterize"):
+        run = run_supervised(
+            settings.PREVIEW_RASTERIZE_COMMAND + [pdf, prefix], working_directory,
+            timeout=settings.COMPILE_TIMEOUT, limits=settings.COMPILE_LIMITS,
+        )
+    if run.return_code != 0 or not os.path.exists(prefix + extension):
+        raise PreviewError("rasterizing the preview failed with return code {}".format(run.return_code))
+    return artifact_cache().put(key, prefix + extension, extension)
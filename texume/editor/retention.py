@@ -0,0 +1,95 @@
+import datetime as dt
+from typing import Iterable, List, NamedTuple, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from editor import revisions
+from editor.models import Content
+
+
+class RetentionPolicy(NamedTuple):
+    """
+    Revisions of a (user, section) worth keeping: the newest `keep_last`,
+    plus the newest revision of each of the last `keep_daily` days. The
+    newest revision, the current content, is always kept.
+    """
+    keep_last: int = 20
+    keep_daily: int = 30
+
+    @classmethod
+    def from_settings(cls):
+        return cls(**settings.CONTENT_RETENTION)
+
+    def prunable(self, revisions: Iterable[Tuple[int, dt.datetime]], now: dt.datetime) -> List[int]:
+        """
+        Ids to delete out of (id, created) pairs ordered newest first.
+        """
+        since = now - dt.timedelta(days=self.keep_daily)
+        days_seen = set()
+        prunable = []
+        for position, (content_id, created) in enumerate(revisions):
+            day = timezone.localdate(created)
+            if position == 0 or position < self.keep_last:
+                days_seen.add(day)
+                continue
+            if created >= since and day not in days_seen:
+                days_seen.add(day)
+                continue
+            prunable.append(content_id)
+        return prunable
+
+
+def prunable_ids(policy: RetentionPolicy, now: dt.datetime = None) -> Iterable[Tuple[int, str, List[int]]]:
+    """
+    Prunable Content ids as (user id, section, ids) for each (user, section).
+    """
+    now = now or timezone.now()
+    pairs = (
+        Content.objects
+            .order_by()
+            .values_list('user_id', 'section')
+            .distinct()
+        )
+    for user_id, section in list(pairs):
+        history = (
+            Content.objects
+                .filter(user_id=user_id, section=section)
+                .order_by('-created', '-id')
+                .values_list('id', 'created')
+            )
+        ids = policy.prunable(history.iterator(), now)
+        if ids:
+            yield user_id, section, ids
+
+
+def _chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def compact(policy: RetentionPolicy, batch_size: int = 500, dry_run: bool = False) -> dict:
+    """
+    Delete revisions outside the policy, `batch_size` rows per transaction.
+    Returns how many rows and body bytes were (or with dry_run would be)
+    reclaimed.
+    """
+    report = {'rows': 0, 'body_bytes': 0}
+    for user_id, section, ids in prunable_ids(policy):
+        if not dry_run:
+            # kept revisions stored as deltas against deleted ones need their bodies
+            revisions.detach(user_id, section, ids)
+        for chunk in _chunks(ids, batch_size):
+            with transaction.atomic():
+                rows = Content.objects.filter(id__in=chunk)
+                size = rows.aggregate(
+                    size=Sum(Length('body')) + Sum(Length('delta'))
+                )['size'] or 0
+                if not dry_run:
+                    rows.delete()
+            report['rows'] += len(chunk)
+            report['body_bytes'] += size
+    return report
@@ -0,0 +1,172 @@
+"""
+Delta-encoded Content history.
+
+The latest revision of a (user, section) always stores its full body. When a
+newer revision arrives, the previous one is rewritten as a reverse delta
+against it (`Content.delta`, with an empty `body` and no `parsed`), except every
+REVISION_SNAPSHOT_INTERVAL-th revision which stays a full snapshot, so
+rebuilding any revision applies a bounded number of deltas.
+"""
+import difflib
+import json
+from typing import Iterator, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Length
+
+from editor.models import Content
+
+
+def encode_delta(newer: str, older: str) -> str:
+    """
+    Instructions rebuilding `older` from `newer`: ["=", start, end] copies
+    lines of `newer`, a list of strings inserts those lines.
+    """
+    newer_lines = newer.splitlines(keepends=True)
+    older_lines = older.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, newer_lines, older_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(["=", i1, i2])
+        elif j2 > j1:  # replace or insert; deletes just skip lines of newer
+            ops.append(older_lines[j1:j2])
+    return json.dumps(ops, separators=(',', ':'))
+
+
+def apply_delta(newer: str, delta: str) -> str:
+    newer_lines = newer.splitlines(keepends=True)
+    older_lines = []
+    for op in json.loads(delta):
+        if op and op[0] == "=" and len(op) == 3 and isinstance(op[1], int):
+            older_lines.extend(newer_lines[op[1]:op[2]])
+        else:
+            older_lines.extend(op)
+    return "".join(older_lines)
+
+
+def _history(user_id: int, section: str):
+    return Content.objects.filter(user_id=user_id, section=section)
+
+
+def _newer_than(content: Content):
+    return Q(created__gt=content.created) | Q(created=content.created, id__gt=content.id)
+
+
+def store_revision(content: Content):
+    """
+    Called once `content` is saved: turns the revision right before it into
+    a delta against it, unless that one is due to be a snapshot or a delta
+    would not be smaller. Revisions saved after `content` (overlapping
+    saves) are left alone.
+    """
+    history = _history(content.user_id, content.section).exclude(id=content.id)
+    # no savepoint: inside the caller's transaction this adds no queries
+    with transaction.atomic(savepoint=False):
+        previous = (
+            history
+                .exclude(_newer_than(content))
+                .select_for_update()
+                .order_by('-created', '-id')
+                .only('id', 'body', 'delta', 'created')
+                .first()
+            )
+        if previous is None or previous.delta:
+            return
+        older = history.exclude(_newer_than(previous)).exclude(id=previous.id)
+        run = 0  # deltas right behind `previous` that would grow with it
+        for delta in older.order_by('-created', '-id').values_list('delta', flat=True).iterator():
+            if not delta:
+                break
+            run += 1
+        if run + 1 >= settings.REVISION_SNAPSHOT_INTERVAL:
+            return
+        delta = encode_delta(content.body, previous.body)
+        if len(delta) < len(previous.body):
+            Content.objects.filter(id=previous.id).update(body="", delta=delta, parsed=None)
+
+
+def revision_body(content: Content) -> str:
+    """
+    Full body of any revision, applying the deltas between it and the
+    nearest newer full revision.
+    """
+    if not content.delta:
+        return content.body
+    newer = (
+        _history(content.user_id, content.section)
+            .filter(_newer_than(content))
+            .order_by('created', 'id')
+            .values_list('body', 'delta')
+        )
+    deltas = [content.delta]
+    for body, delta in newer.iterator():
+        if not delta:
+            break
+        deltas.append(delta)
+    else:
+        raise ValueError("revision {} has no full revision after it".format(content.id))
+    for delta in reversed(deltas):
+        body = apply_delta(body, delta)
+    return body
+
+
+def list_revisions(user_id: int, section: str):
+    """
+    Revisions newest first, with sizes but without loading any body.
+    """
+    return (
+        _history(user_id, section)
+            .order_by('-created', '-id')
+            .annotate(body_size=Length('body'), delta_size=Length('delta'))
+            .values('id', 'created', 'formatting', 'body_size', 'delta_size')
+        )
+
+
+def diff_revisions(old: Content, new: Content) -> Iterator[str]:
+    return difflib.unified_diff(
+        revision_body(old).splitlines(keepends=True),
+        revision_body(new).splitlines(keepends=True),
+        fromfile="revision {}".format(old.id),
+        tofile="revision {}".format(new.id),
+    )
+
+
+def materialize(ids: List[int]):
+    """
+    Store full bodies for these revisions.
+    """
+    bodies = {
+        content.id: revision_body(content)
+        for content in Content.objects.filter(id__in=ids).exclude(delta="")
+    }
+    with transaction.atomic():
+        for content_id, body in bodies.items():
+            Content.objects.filter(id=content_id).update(body=body, delta="")
+
+
+def detach(user_id: int, section: str, deleted_ids: List[int]):
+    """
+    Materialize the revisions that will be kept but whose deltas depend on
+    one of `deleted_ids`; call before deleting those.
+    """
+    deleted_ids = set(deleted_ids)
+    history = (
+        _history(user_id, section)
+            .order_by('-created', '-id')
+            .annotate(delta_size=Length('delta'))
+            .values_list('id', 'delta_size')
+        )
+    broken = False
+    needs_body = []
+    for content_id, delta_size in history.iterator():
+        if content_id in deleted_ids:
+            broken = True
+        elif not delta_size:
+            broken = False
+        elif broken:
+            needs_body.append(content_id)
+            broken = False
+    materialize(needs_body)
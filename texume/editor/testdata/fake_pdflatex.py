@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+Stand-in for pdflatex in tests and benchmarks: writes a tiny pdf (or a .fmt
+when called with -ini) for the given .tex file. FAKE_PDFLATEX_SLEEP delays
+it, FAKE_PDFLATEX_EXIT fails it, FAKE_PDFLATEX_LOG is written as its log and
+FAKE_PDFLATEX_AUX as its .aux file.
+"""
+import os
+import sys
+import time
+
+if __name__ == "__main__":
+    options = dict(
+        arg.lstrip("-").split("=", 1) if "=" in arg else (arg.lstrip("-"), "")
+        for arg in sys.argv[1:] if arg.startswith("-")
+    )
+    tex_file = [arg for arg in sys.argv[1:] if arg.endswith(".tex")][-1]
+    jobname = options.get("jobname", os.path.splitext(os.path.basename(tex_file))[0])
+    output = os.path.join(
+        options.get("output-directory", "."),
+        jobname + (".fmt" if "ini" in options else ".pdf"),
+    )
+    time.sleep(float(os.environ.get("FAKE_PDFLATEX_SLEEP", "0")))
+    exit_code = int(os.environ.get("FAKE_PDFLATEX_EXIT", "0"))
+    with open(os.path.join(options.get("output-directory", "."), jobname + ".log"), "w") as f:
+        f.write(os.environ.get("FAKE_PDFLATEX_LOG", "This is a fake pdfTeX\n"))
+    if exit_code == 0 and "ini" not in options:
+        with open(os.path.join(options.get("output-directory", "."), jobname + ".aux"), "w") as f:
+            f.write(os.environ.get("FAKE_PDFLATEX_AUX", "\\relax\n"))
+    if exit_code == 0 and "draftmode" not in options:
+        with open(output, "wb") as f:
+            f.write(b"%PDF-1.4\n% fake\n%%EOF\n")
+    sys.exit(exit_code)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+"""
+Stand-in for pdftoppm in tests: writes a tiny png for `pdftoppm ... in.pdf
+out`, as out.png. FAKE_PDFTOPPM_EXIT fails it.
+"""
+import os
+import sys
+
+if __name__ == "__main__":
+    pdf, prefix = sys.argv[-2:]
+    exit_code = int(os.environ.get("FAKE_PDFTOPPM_EXIT", "0"))
+    if exit_code == 0:
+        with open(pdf, "rb") as f:
+            assert f.read(4) == b"%PDF"
+        with open(prefix + ".png", "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n fake")
+    sys.exit(exit_code)
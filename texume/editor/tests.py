@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User as AuthUser
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from model_mommy import mommy
+
+from editor import benchmarks, delivery, jobs, metrics, precompile, preview, retention, revisions
+from editor.artifacts import ArtifactCache, TEMPLATE_FILES
+from editor.benchmarks import FAKE_PDFLATEX
+from editor.middleware import QueryBudgetExceeded, QueryBudgetMiddleware, query_budget
+from editor.compiler import (
+    AsyncCompileEngine, CompileEngine, CompileResult, CompilerBusy, run_supervised, run_supervised_async,
+)
+from editor.forms import PartialContentForm
+from editor.models import (
+    CompileError, Content, GenerateJob, Resume, TexFormats, User, fragment_cache, latest_content,
+    parse_body,
+)
+from editor.texlog import Diagnostic, parse_log
+from editor.texformat import PreambleFormat
+from editor.workspace import Workspace
+
+
+class FakeToolchainMixin:
+    """
+    Runs each test on benchmarks.FakeToolchain, exposed as self.toolchain
+    plus the usual self._dir, self.workspace, self.cache and self.engine.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.toolchain = benchmarks.FakeToolchain()
+        self.toolchain.__enter__()
+        self.addCleanup(self.toolchain.__exit__, None, None, None)
+        self._dir = self.toolchain.directory
+        self.workspace = self.toolchain.workspace
+        self.cache = self.toolchain.cache
+        self.engine = self.toolchain.engine
+
+
+class ArtifactCacheTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._src = os.path.join(self._dir, "src")
+        os.makedirs(self._src)
+        for name in TEMPLATE_FILES:
+            with open(os.path.join(self._src, name), "w") as f:
+                f.write(name)
+        self._pdf = os.path.join(self._dir, "out.pdf")
+        with open(self._pdf, "wb") as f:
+            f.write(b"%PDF" + b"x" * 96)
+        self.cache = ArtifactCache(
+            os.path.join(self._dir, "cache"), self._src,
+            max_bytes=250,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_hit_and_miss(self):
+        key = self.cache.key("user data")
+        self.assertIsNone(self.cache.get_path(key))
+        path = self.cache.put(key, self._pdf)
+        self.assertEqual(self.cache.get_path(key), path)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(4), b"%PDF")
+        stats = self.cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['disk_hits'], 1)
+
+    def test_disk_tier_bounded(self):
+        keys = [self.cache.key("user {}".format(i)) for i in range(3)]
+        for key in keys:
+            self.cache.put(key, self._pdf)
+        self.assertLessEqual(self.cache.stats()['disk_bytes'], 250)
+        self.assertIsNotNone(self.cache.get_path(keys[-1]))
+
+    def test_store_walks_only_over_budget(self):
+        keys = [self.cache.key("user {}".format(i)) for i in range(3)]
+        self.cache.put(keys[0], self._pdf)
+        with mock.patch.object(self.cache, '_disk_entries', wraps=self.cache._disk_entries) as walk:
+            self.cache.put(keys[1], self._pdf)
+            self.cache.put(keys[1], self._pdf)
+            self.assertEqual(walk.call_count, 0)
+            self.cache.put(keys[2], self._pdf)
+            self.assertEqual(walk.call_count, 1)
+        self.assertEqual(self.cache.stats()['disk_evictions'], 1)
+        self.assertEqual(self.cache._disk_bytes, 200)
+
+    def test_template_change_invalidates(self):
+        key = self.cache.key("user data")
+        self.cache.put(key, self._pdf)
+        with open(os.path.join(self._src, "macros.tex"), "a") as f:
+            f.write("% changed")
+        self.assertNotEqual(key, self.cache.key("user data"))
+        self.assertIsNone(self.cache.get_path(key))
+        self.assertEqual(self.cache.stats()['disk_bytes'], 0)
+
+
+class CompileEngineTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_compile(self):
+        engine = CompileEngine(FAKE_PDFLATEX, workers=1, queue_size=1)
+        result = engine.compile(self._dir, ["user-resume.tex"])
+        self.assertTrue(result.ok)
+        self.assertTrue(os.path.exists(os.path.join(self._dir, "user-resume.pdf")))
+        self.assertEqual(engine.stats()['succeeded'], 1)
+
+    def test_busy_when_saturated(self):
+        engine = CompileEngine(FAKE_PDFLATEX, workers=1, queue_size=1)
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_SLEEP": "0.5"}):
+            running = engine.submit(self._dir, ["user-resume.tex"])
+            while engine.stats()['running'] == 0:
+                time.sleep(0.01)
+            queued = engine.submit(self._dir, ["user-resume.tex"])
+            with self.assertRaises(CompilerBusy):
+                engine.submit(self._dir, ["user-resume.tex"])
+            self.assertEqual(engine.queue_depth, 1)
+            self.assertTrue(running.result().ok)
+            self.assertGreater(queued.result().wait_time, 0.1)
+
+    def test_timeout(self):
+        engine = CompileEngine(FAKE_PDFLATEX, workers=1, queue_size=1, timeout=0.2)
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_SLEEP": "5"}):
+            result = engine.compile(self._dir, ["user-resume.tex"])
+        self.assertIsNone(result.return_code)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(engine.stats()['timeouts'], 1)
+
+    def test_deadline_kills_process_group(self):
+        marker = os.path.join(self._dir, "orphan-survived")
+        result = run_supervised(
+            ["sh", "-c", "(sleep 1; touch {}) & sleep 5".format(marker)],
+            self._dir, timeout=0.2,
+        )
+        self.assertTrue(result.timed_out)
+        self.assertLess(result.wall_time, 1)
+        time.sleep(1.2)
+        self.assertFalse(os.path.exists(marker))
+
+    def test_resource_limits(self):
+        result = run_supervised(
+            ["sh", "-c", "head -c 4096 /dev/zero > big"],
+            self._dir, limits={'output': 1024},
+        )
+        self.assertNotEqual(result.return_code, 0)
+        self.assertFalse(result.timed_out)
+        self.assertGreater(result.max_rss, 0)
+
+
+class AsyncCompileEngineTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _directories(self, n):
+        directories = [os.path.join(self._dir, str(i)) for i in range(n)]
+        for directory in directories:
+            os.makedirs(directory)
+        return directories
+
+    def test_compiles_in_flight(self):
+        engine = AsyncCompileEngine(FAKE_PDFLATEX, concurrency=4)
+
+        async def compile_all(directories):
+            return await asyncio.gather(*[
+                engine.compile(directory, ["user-resume.tex"]) for directory in directories
+            ])
+
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_SLEEP": "0.5"}):
+            started = time.monotonic()
+            results = asyncio.run(compile_all(self._directories(4)))
+        # one thread, four compiles overlapping
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(engine.stats()['succeeded'], 4)
+
+    def test_busy_and_timeout(self):
+        engine = AsyncCompileEngine(FAKE_PDFLATEX, concurrency=1, queue_size=1, timeout=0.3)
+
+        async def compile_all(directories):
+            return await asyncio.gather(*[
+                engine.compile(directory, ["user-resume.tex"]) for directory in directories
+            ], return_exceptions=True)
+
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_SLEEP": "5"}):
+            first, second, third = asyncio.run(compile_all(self._directories(3)))
+        self.assertTrue(first.timed_out)
+        self.assertTrue(second.timed_out)
+        self.assertIsInstance(third, CompilerBusy)
+        self.assertEqual(engine.stats()['timeouts'], 2)
+
+    def test_deadline_kills_process_group(self):
+        marker = os.path.join(self._dir, "orphan-survived")
+        result = asyncio.run(run_supervised_async(
+            ["sh", "-c", "(sleep 1; touch {}) & sleep 5".format(marker)],
+            self._dir, timeout=0.2,
+        ))
+        self.assertTrue(result.timed_out)
+        time.sleep(1.2)
+        self.assertFalse(os.path.exists(marker))
+
+    def test_resource_limits(self):
+        result = asyncio.run(run_supervised_async(
+            ["sh", "-c", "head -c 4096 /dev/zero > big"],
+            self._dir, limits={'output': 1024},
+        ))
+        self.assertNotEqual(result.return_code, 0)
+        self.assertFalse(result.timed_out)
+
+
+class PreambleFormatTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._src = os.path.join(self._dir, "src")
+        os.makedirs(self._src)
+        for name in TEMPLATE_FILES:
+            with open(os.path.join(self._src, name), "w") as f:
+                f.write(name)
+        self.fmt = PreambleFormat(
+            self._src, os.path.join(self._dir, "formats"), command=FAKE_PDFLATEX
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_rebuilt_when_templates_change(self):
+        self.assertTrue(self.fmt.is_stale())
+        path = self.fmt.ensure()
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(self.fmt.is_stale())
+        with open(os.path.join(self._src, "resume.cls"), "a") as f:
+            f.write("% changed")
+        self.assertTrue(self.fmt.is_stale())
+        new_path = self.fmt.ensure()
+        self.assertNotEqual(path, new_path)
+        self.assertFalse(os.path.exists(path))
+
+    def test_build_failure_falls_back(self):
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_EXIT": "1"}):
+            self.assertIsNone(self.fmt.ensure())
+        with override_settings(LATEX_USE_FORMAT=True):
+            self.assertEqual(self.fmt.compile_args(), [])
+
+    def test_failed_rebuild_keeps_previous_format(self):
+        path = self.fmt.ensure()
+        with open(os.path.join(self._src, "resume.cls"), "a") as f:
+            f.write("% changed")
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_EXIT": "1"}):
+            self.assertIsNone(self.fmt.ensure())
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(
+            sorted(os.listdir(self.fmt.format_dir)),
+            sorted([".lock", os.path.basename(os.path.dirname(path))]),
+        )
+
+    def test_compile_args_build_in_background(self):
+        with override_settings(LATEX_USE_FORMAT=True):
+            self.assertEqual(self.fmt.compile_args(), [])
+            self.fmt._building.join()
+            self.assertEqual(self.fmt.compile_args(), ["-fmt={}".format(self.fmt.path())])
+
+
+class WorkspaceTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.workspace = Workspace(
+            self._dir, os.path.join(self._dir, "scratch"), max_age=60, max_bytes=10
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_scratch_removed_after_use(self):
+        with self.workspace.scratch() as path:
+            self.assertTrue(os.path.isdir(path))
+        self.assertFalse(os.path.exists(path))
+        self.assertIn(self._dir, self.workspace.env()['TEXINPUTS'].split(os.pathsep))
+
+    def test_sweep_by_age_and_size(self):
+        root = self.workspace.scratch_root
+        for name, age, size in [("old", 120, 1), ("big", 0, 8), ("new", 0, 8)]:
+            os.makedirs(os.path.join(root, name))
+            with open(os.path.join(root, name, "user-data.tex"), "w") as f:
+                f.write("x" * size)
+            mtime = time.time() - age - (1 if name == "big" else 0)
+            os.utime(os.path.join(root, name), (mtime, mtime))
+        self.assertEqual(self.workspace.sweep(), 2)
+        self.assertEqual(os.listdir(root), ["new"])
+
+
+class ResumeCompileTestCase(FakeToolchainMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._profile = mommy.make(User)
+
+    def test_save_latex(self):
+        resume = Resume(self._profile.user)
+        path = resume.save_latex()
+        self.assertTrue(path.startswith(self.cache.directory))
+        self.assertEqual(os.listdir(self.workspace.scratch_root), [])
+        self.assertEqual(resume.save_latex(), path)
+        self.assertEqual(self.engine.stats()['submitted'], 2)  # draft pass + final pass
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(4), b"%PDF")
+
+    def test_incremental_passes(self):
+        def edit(body):
+            mommy.make(
+                Content, user=self._profile, section=Content.Section.COURSES,
+                formatting=Content.Formatting.TEXT, body=body,
+            )
+            Resume(self._profile.user).save_latex()
+            return self.engine.stats()['submitted']
+
+        self.assertEqual(edit("first"), 2)  # no aux state yet: draft + final
+        self.assertEqual(edit("second"), 3)  # aux state unchanged: one pass
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_AUX": "\\newlabel{x}"}):
+            self.assertEqual(edit("third"), 5)  # aux changed: rerun once
+
+    def test_compile_error_diagnostics(self):
+        mommy.make(
+            Content, user=self._profile, section=Content.Section.COURSES,
+            formatting=Content.Formatting.TEXT, body="first course \\badmacro",
+        )
+        fragments = Resume(self._profile.user)._render_fragments("latex")
+        line = 1 + sum(
+            text.count("\n") for section, text in
+            fragments[:[section for section, _ in fragments].index("Courses")]
+        ) + 1
+        log = "./user-data.tex:{0}: Undefined control sequence.\nl.{0}     first course \\badmacro\n".format(line)
+        self.client.force_login(self._profile.user)
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_EXIT": "1", "FAKE_PDFLATEX_LOG": log}):
+            response = self.client.get("/editor/generate/")
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("no-store", response['Cache-Control'])
+        diagnostic, = response.context['diagnostics']
+        self.assertEqual(diagnostic.section, "Courses")
+        self.assertEqual(diagnostic.section_line, 2)
+        self.assertEqual(diagnostic.message, "Undefined control sequence.")
+
+    def test_conditional_get(self):
+        self.client.force_login(self._profile.user)
+        response = self.client.get("/editor/generate/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response['Cache-Control'])
+        self.assertIn("private", response['Cache-Control'])
+        submitted = self.engine.stats()['submitted']
+
+        with mock.patch.object(Resume, '_render_fragments') as render:
+            cached = self.client.get("/editor/generate/", HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached['ETag'], response['ETag'])
+            cached = self.client.get(
+                "/editor/generate/", HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+            self.assertEqual(cached.status_code, 304)
+            render.assert_not_called()
+        self.assertEqual(self.engine.stats()['submitted'], submitted)
+
+        Content.objects.create(user=self._profile, section=Content.Section.COURSES, body="new")
+        changed = self.client.get("/editor/generate/", HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertNotEqual(
+            Resume(self._profile.user).etag("pdf"), Resume(self._profile.user).etag("latex")
+        )
+
+    def test_last_modified_follows_templates(self):
+        self.client.force_login(self._profile.user)
+        template = os.path.join(self._dir, "resume.cls")
+        with open(template, "w") as f:
+            f.write("% changed")
+        changed = time.time() + 3600
+        os.utime(template, (changed, changed))
+        response = self.client.get("/editor/generate/")
+        self.assertEqual(response['Last-Modified'], http_date(int(changed)))
+        self.assertLess(Resume(self._profile.user).last_modified("latex"), changed)
+
+    def test_range_request(self):
+        self.client.force_login(self._profile.user)
+        response = self.client.get("/editor/generate/", HTTP_RANGE="bytes=0-3")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"%PDF")
+        self.assertEqual(response['ETag'], Resume(self._profile.user).etag("pdf"))
+
+    def test_generate_async(self):
+        async_engine = self.toolchain.async_engine
+        self.async_client.force_login(self._profile.user)
+        # async_to_sync keeps the database access on this thread's connection
+        response = async_to_sync(self.async_client.get)("/editor/generate/async/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content)[:4], b"%PDF")
+        self.assertEqual(async_engine.stats()['submitted'], 2)  # draft pass + final pass
+        cached = async_to_sync(self.async_client.get)(
+            "/editor/generate/async/", **{'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.engine.stats().get('submitted', 0), 0)
+        # the sync view serves the artifact the async one compiled
+        self.client.force_login(self._profile.user)
+        self.assertEqual(self.client.get("/editor/generate/")['ETag'], response['ETag'])
+        self.assertEqual(self.engine.stats().get('submitted', 0), 0)
+
+    def test_precompile(self):
+        precompiler = precompile.Precompiler(delay=2.0, max_delay=5.0)
+        with mock.patch('editor.precompile.precompiler', return_value=precompiler), \
+                mock.patch('editor.precompile.transaction.on_commit', side_effect=lambda f: f()):
+            for body in ["one", "two", "three"]:
+                Content.objects.create(user=self._profile, section=Content.Section.COURSES, body=body)
+        # a burst of saves is one compile
+        self.assertEqual(precompiler.pop_due(time.monotonic() + 2.5), [self._profile.id])
+        self.assertEqual(precompiler.pop_due(time.monotonic() + 2.5), [])
+
+        self.assertTrue(precompile.precompile(self._profile.id))
+        submitted = self.engine.stats()['submitted']
+        self.client.force_login(self._profile.user)
+        self.assertEqual(self.client.get("/editor/generate/").status_code, 200)
+        self.assertEqual(self.engine.stats()['submitted'], submitted)
+
+    def test_precompile_debounce(self):
+        precompiler = precompile.Precompiler(delay=2.0, max_delay=5.0)
+        for now in [0.0, 1.5, 3.0, 4.5]:
+            precompiler.schedule(1, now=now)
+            self.assertEqual(precompiler.pop_due(now), [])
+        # edits kept coming, but the first one is max_delay ago
+        self.assertEqual(precompiler.pop_due(5.0), [1])
+
+    def test_server_timing_and_metrics(self):
+        counters = dict(metrics.registry().counters)
+        self.client.force_login(self._profile.user)
+        response = self.client.get("/editor/generate/")
+        self.assertEqual(response.status_code, 200)
+        stages = [entry.split(";")[0] for entry in response['Server-Timing'].split(", ")]
+        for stage in ["latest_content", "render", "cache", "workspace", "pdflatex", "store", "total"]:
+            self.assertIn(stage, stages)
+
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_EXIT": "1"}):
+            Content.objects.create(user=self._profile, section=Content.Section.COURSES, body="x")
+            self.assertEqual(self.client.get("/editor/generate/").status_code, 422)
+        self.assertEqual(metrics.registry().counters['compiles'], counters['compiles'] + 2)
+        self.assertEqual(
+            metrics.registry().counters['compile_failures'], counters['compile_failures'] + 1
+        )
+
+        exposition = self.client.get("/editor/metrics").content.decode()
+        self.assertIn('texume_stage_seconds_count{stage="pdflatex"}', exposition)
+        self.assertIn("texume_compile_timeouts_total", exposition)
+
+
+class DeliveryTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self.cache = ArtifactCache(os.path.join(self._dir, "cache"), self._dir)
+        self._pdf = os.path.join(self._dir, "cache", "fingerprint", "key.pdf")
+        os.makedirs(os.path.dirname(self._pdf))
+        with open(self._pdf, "wb") as f:
+            f.write(bytes(range(100)))
+        patch = mock.patch('editor.delivery.artifact_cache', return_value=self.cache)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _get(self, etag=None, **headers):
+        response = delivery.pdf_response(RequestFactory().get("/", **headers), self._pdf, etag)
+        if response.streaming:
+            body = b"".join(response.streaming_content)
+            response.close()
+            return response, body
+        return response, response.content
+
+    def test_parse_range(self):
+        self.assertEqual(delivery.parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(delivery.parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(delivery.parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(delivery.parse_range("bytes=50-500", 100), (50, 99))
+        self.assertIs(delivery.parse_range("bytes=100-", 100), delivery.UNSATISFIABLE)
+        self.assertIsNone(delivery.parse_range("bytes=0-1,5-6", 100))
+        self.assertIsNone(delivery.parse_range(None, 100))
+
+    def test_ranges(self):
+        response, body = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], "bytes")
+        self.assertEqual(body, bytes(range(100)))
+
+        response, body = self._get(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], "bytes 10-19/100")
+        self.assertEqual(body, bytes(range(10, 20)))
+
+        response, _ = self._get(HTTP_RANGE="bytes=200-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], "bytes */100")
+
+        # a range of an older version is answered with the whole file
+        response, body = self._get('"new"', HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(body), 100)
+
+    def test_offload(self):
+        with override_settings(PDF_OFFLOAD="x-accel-redirect", PDF_OFFLOAD_PREFIX="/protected/"):
+            response, body = self._get()
+            self.assertEqual(response['X-Accel-Redirect'], "/protected/fingerprint/key.pdf")
+            self.assertEqual(body, b"")
+        with override_settings(PDF_OFFLOAD="x-sendfile"):
+            response, _ = self._get()
+            self.assertEqual(response['X-Sendfile'], self._pdf)
+            os.remove(self._pdf)
+            with self.assertRaises(FileNotFoundError):
+                self._get()
+
+
+class MetricsTestCase(SimpleTestCase):
+
+    def test_histogram(self):
+        histogram = metrics.Histogram(buckets=(0.1, 1.0))
+        for value in [0.05, 0.1, 0.5, 2.0]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [2, 3, 4])
+        self.assertEqual(histogram.count, 4)
+
+    def test_server_timing(self):
+        token = metrics.start_request()
+        metrics.record("pdflatex", 0.25)
+        metrics.record("pdflatex", 0.5)
+        with metrics.stage("render"):
+            pass
+        timings = metrics.end_request(token)
+        header = metrics.server_timing(timings)
+        self.assertTrue(header.startswith("pdflatex;dur=750.0, render;dur="))
+        metrics.record("render", 1.0)  # outside a request
+        self.assertEqual(len(timings), 3)
+
+    def test_metrics_only_local(self):
+        self.assertEqual(self.client.get("/editor/metrics").status_code, 200)
+        self.assertEqual(
+            self.client.get("/editor/metrics", REMOTE_ADDR="10.0.0.1").status_code, 404
+        )
+        self.assertEqual(
+            self.client.get("/editor/metrics", HTTP_X_FORWARDED_FOR="10.0.0.1").status_code, 404
+        )
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/editor/metrics").status_code, 404)
+        self.assertEqual(
+            self.client.get("/editor/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 404
+        )
+        self.assertEqual(
+            self.client.get("/editor/metrics", HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200
+        )
+
+
+class PreviewTestCase(FakeToolchainMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        fragment_cache().clear()
+        self._profile = mommy.make(User)
+        self._content = Content.objects.create(
+            user=self._profile, section=Content.Section.COURSES,
+            formatting=Content.Formatting.TEXT, body="compilers, databases",
+        )
+        self.client.force_login(self._profile.user)
+
+    def _get(self, section="Courses", image="pdf", **headers):
+        response = self.client.get(
+            "/editor/content/preview/", {'section': section, 'image': image}, **headers
+        )
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_preview_data(self):
+        data = preview.preview_data(self._content)
+        self.assertIn("compilers, databases", data)
+        self.assertIn("\\newcommand{\\previewSection}{\\courses}", data)
+
+    def test_saved_section(self):
+        response, body = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], "application/pdf")
+        self.assertEqual(body[:4], b"%PDF")
+        self.assertEqual(self.engine.stats()['submitted'], 1)  # a single pass
+
+        self.assertEqual(self._get()[0].status_code, 200)
+        cached, _ = self._get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.engine.stats()['submitted'], 1)
+
+    def test_thumbnail(self):
+        response, body = self._get(image="png")
+        self.assertEqual(response['Content-Type'], "image/png")
+        self.assertEqual(body[:4], b"\x89PNG")
+        self.assertEqual(self._get()[0].status_code, 200)  # the pdf came along
+        self.assertEqual(self.engine.stats()['submitted'], 1)
+        with mock.patch.dict(os.environ, {"FAKE_PDFTOPPM_EXIT": "1"}):
+            Content.objects.create(user=self._profile, section=Content.Section.COURSES, body="new")
+            self.assertEqual(self._get(image="png")[0].status_code, 500)
+
+    def test_unsaved_form(self):
+        response = self.client.post("/editor/content/preview/", {
+            'section': "Courses", 'formatting': "text", 'body': "draft \\badmacro",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Content.objects.count(), 1)
+        self.assertNotIn('ETag', response)
+
+    def test_errors(self):
+        self.assertEqual(self._get(section="Name")[0].status_code, 404)
+        log = "./preview-data.tex:2: Undefined control sequence.\nl.2 \\badmacro\n"
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_EXIT": "1", "FAKE_PDFLATEX_LOG": log}):
+            response, _ = self._get()
+        self.assertEqual(response.status_code, 422)
+        diagnostic, = response.context['diagnostics']
+        self.assertEqual(diagnostic.section, "Courses")
+
+
+class TexLogTestCase(SimpleTestCase):
+
+    def test_parse_log(self):
+        log = [
+            "(./user-resume.tex\n",
+            "./user-data.tex:12: Undefined control sequence.\n",
+            "<argument> \\foo\n",
+            "l.12     first \\foo\n",
+            "! LaTeX Error: File `missing.sty' not found.\n",
+            "\n",
+            "! Emergency stop.\n",
+        ]
+        diagnostics = list(parse_log(log))
+        self.assertEqual(len(diagnostics), 3)
+        self.assertEqual(diagnostics[0].file, "user-data.tex")
+        self.assertEqual(diagnostics[0].line, 12)
+        self.assertEqual(diagnostics[0].context, "first \\foo")
+        self.assertEqual(diagnostics[1].message, "LaTeX Error: File `missing.sty' not found.")
+        self.assertIsNone(diagnostics[1].line)
+
+
+class TexFormatsTestCase(SimpleTestCase):
+
+    def test_placeholder_words_in_body(self):
+        content = Content(
+            section=Content.Section.PROFESSIONAL_EXPERIANCE,
+            formatting=Content.Formatting.ORG_LOC_TITLE_DATE_POINTS,
+            body="ORG LOC\nTITLE place\nDATE title\n2019\nshipped ITEM and LINK",
+        )
+        self.assertIn(
+            r"\OrgLocTitleDate{ORG LOC}{TITLE place}{DATE title}{2019}",
+            content.render("latex"),
+        )
+        self.assertIn(r"\item {shipped ITEM and LINK}", content.render("latex"))
+        header = TexFormats.format_header(**{Content.Section.NAME: "NAME LINK"})
+        self.assertIn(r"\Large{NAME LINK}", header)
+
+
+@override_settings(JOB_WORKER_AUTOSTART=False)
+class GenerateJobTestCase(TestCase):
+
+    def setUp(self):
+        self._profile = mommy.make(User)
+        self.client.force_login(self._profile.user)
+        self._dir = tempfile.mkdtemp()
+        self._pdf = os.path.join(self._dir, "user-resume.pdf")
+        with open(self._pdf, "wb") as f:
+            f.write(b"%PDF-1.4")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_submit_status_download(self):
+        response = self.client.post("/editor/generate/jobs/")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['id']
+        self.assertEqual(response.json()['status'], GenerateJob.Status.QUEUED)
+
+        with mock.patch.object(Resume, 'save_latex', return_value=self._pdf):
+            jobs.run_pending()
+
+        status = self.client.get(response['Location']).json()
+        self.assertEqual(status['status'], GenerateJob.Status.DONE)
+        download = self.client.get(status['download'])
+        self.assertEqual(b"".join(download.streaming_content), b"%PDF-1.4")
+
+    def test_failed_job(self):
+        job = jobs.submit(self._profile)
+        error = CompileError(CompileResult(1, 0.0, 0.1), [Diagnostic("Undefined control sequence.")])
+        with mock.patch.object(Resume, 'save_latex', side_effect=error):
+            jobs.run_pending()
+        status = self.client.get("/editor/generate/jobs/{}/".format(job.id)).json()
+        self.assertEqual(status['status'], GenerateJob.Status.FAILED)
+        self.assertIn("Undefined control sequence.", status['error'])
+        self.assertEqual(
+            self.client.get("/editor/generate/jobs/{}/pdf".format(job.id)).status_code, 404
+        )
+
+    def test_busy_compiler_requeues(self):
+        job = jobs.submit(self._profile)
+        with mock.patch.object(Resume, 'save_latex', side_effect=CompilerBusy):
+            self.assertFalse(jobs.run_next())
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerateJob.Status.QUEUED)
+
+    def test_stale_running_job_requeued(self):
+        job = jobs.submit(self._profile)
+        GenerateJob.objects.filter(id=job.id).update(
+            status=GenerateJob.Status.RUNNING,
+            claimed=timezone.now() - datetime.timedelta(seconds=settings.JOB_LEASE - 1),
+        )
+        self.assertFalse(jobs.run_next())  # still within its lease
+        GenerateJob.objects.filter(id=job.id).update(
+            claimed=timezone.now() - datetime.timedelta(seconds=settings.JOB_LEASE + 1),
+        )
+        with mock.patch.object(Resume, 'save_latex', return_value=self._pdf):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerateJob.Status.DONE)
+
+    def test_autostart(self):
+        with mock.patch('editor.jobs.job_worker') as job_worker:
+            jobs.autostart()
+            job_worker.assert_not_called()
+            with self.settings(JOB_WORKER_AUTOSTART=True):
+                jobs.autostart()
+        job_worker.return_value.wake.assert_called_once_with()
+
+
+class BenchmarkTestCase(TestCase):
+
+    def test_run_suite(self):
+        report = benchmarks.run_suite(entries=2, items=2, history=3, number=1)
+        self.assertIn('save_latex_cold', report['results'])
+        self.assertIn('resume_render_latex_cached', report['results'])
+        self.assertIn('content_render_text_markdown_cached', report['results'])
+        self.assertEqual(report['meta']['history'], 3)
+        self.assertEqual(Content.objects.count(), 3 * len(Resume.SECTION_CHOICES))
+
+        baseline = {'results': {
+            name: dict(timing, median=timing['median'] / 10)
+            for name, timing in report['results'].items()
+        }}
+        self.assertEqual(set(benchmarks.regressions(report, baseline)), set(report['results']))
+        self.assertEqual(benchmarks.regressions(report, report), {})
+
+
+class LoadTestTestCase(TransactionTestCase):
+
+    def test_load_test(self):
+        report = benchmarks.load_test(requests=4, threads=2, in_flight=4, sleep=0.2)
+        self.assertEqual(report['wsgi']['requests'], 4)
+        self.assertEqual(report['asgi']['requests'], 4)
+        # two passes of 0.2s each: the async requests overlap, middleware and all
+        self.assertLess(report['asgi']['wall_time'], 4 * 0.4 / 2)
+        self.assertFalse(AuthUser.objects.exists())
+
+
+class LatestContentTestCase(TestCase):
+
+    def test_fetch_single_query(self):
+        content = mommy.make(Content)
+        user = content.user
+        newer = mommy.make(Content, user=user, section=content.section)
+        rr = Resume(user=user.user)
+        with self.assertNumQueries(1):
+            all_latest_content = rr.all_latest_content
+        self.assertEqual(newer, all_latest_content[newer.section])
+        self.assertEqual(newer, latest_content(user.user, newer.section))
+
+
+class FragmentCacheTestCase(TestCase):
+
+    def setUp(self):
+        fragment_cache().clear()
+        self._profile = mommy.make(User)
+        self._courses = mommy.make(
+            Content, user=self._profile, section=Content.Section.COURSES,
+            formatting=Content.Formatting.TEXT, body="first course",
+        )
+
+    def test_sections_rendered_once(self):
+        rendered = []
+        original_render = Content._render
+
+        def render(content, file_format):
+            if content.pk is not None:
+                rendered.append(content.body)
+            return original_render(content, file_format)
+
+        with mock.patch.object(Content, '_render', autospec=True, side_effect=render):
+            Resume(self._profile.user).render("latex")
+            Resume(self._profile.user).render("latex")
+            self.assertEqual(rendered, ["first course"])
+            mommy.make(
+                Content, user=self._profile, section=Content.Section.COURSES,
+                formatting=Content.Formatting.TEXT, body="second course",
+            )
+            self.assertIn("second course", Resume(self._profile.user).render("latex"))
+            self.assertEqual(rendered, ["first course", "second course"])
+
+    def test_edited_row_not_stale(self):
+        self.assertIn("first course", self._courses.render("markdown"))
+        self._courses.body = "edited course"
+        self._courses.save()
+        self.assertIn("edited course", self._courses.render("markdown"))
+
+    def test_content_post_appends(self):
+        self.client.force_login(self._profile.user)
+        self.client.post("/editor/content/", {
+            'section': Content.Section.COURSES,
+            'formatting': Content.Formatting.TEXT,
+            'body': "second course",
+        })
+        self._courses.refresh_from_db()
+        self.assertEqual(self._courses.body, "first course")
+        self.assertEqual(Content.objects.filter(user=self._profile).count(), 2)
+
+
+class ParsedContentTestCase(TestCase):
+
+    def setUp(self):
+        fragment_cache().clear()
+        self._profile = mommy.make(User)
+
+    def test_form_rejects_malformed_body(self):
+        form = PartialContentForm({
+            'section': Content.Section.PROJECT_WORK,
+            'formatting': Content.Formatting.DATE_POINTS,
+            'body': "2019\nbuilt a thing\n\n2018",
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn("entry 2", form.errors['body'][0])
+
+    def test_rendered_from_parsed_body(self):
+        form = PartialContentForm({
+            'section': Content.Section.PROJECT_WORK,
+            'formatting': Content.Formatting.DATE_POINTS,
+            'body': "2019\nbuilt a thing\nshipped it\n\n2018\nplanned it",
+        }, instance=Content(user=self._profile))
+        self.assertTrue(form.is_valid())
+        with mock.patch('editor.models.parse_body', side_effect=AssertionError("parsed twice")):
+            content = form.save()
+            content = Content.objects.get(id=content.id)
+            self.assertEqual(content.parsed, [
+                {'date': "2019", 'points': ["built a thing", "shipped it"]},
+                {'date': "2018", 'points': ["planned it"]},
+            ])
+            self.assertIn("* [2019] built a thing; shipped it", content.render("markdown"))
+            self.assertIn("built a thing\nshipped it", content.render("latex"))
+
+
+    def test_delta_revisions_drop_parsed(self):
+        bodies = ["2019\nbuilt a thing\n\n2018\nplanned it {}".format(i) for i in range(2)]
+        older, newer = [
+            Content.objects.create(
+                user=self._profile, section=Content.Section.PROJECT_WORK,
+                formatting=Content.Formatting.DATE_POINTS, body=body,
+            )
+            for body in bodies
+        ]
+        older = Content.objects.get(id=older.id)
+        self.assertTrue(older.delta)
+        self.assertIsNone(older.parsed)
+        self.assertIn("planned it 0", older.render("markdown"))
+
+        bodies = ["course {},\nalgorithms, compilers,\noperating systems".format(i) for i in range(2)]
+        older, newer = [
+            Content.objects.create(
+                user=self._profile, section=Content.Section.COURSES,
+                formatting=Content.Formatting.TEXT, body=body,
+            )
+            for body in bodies
+        ]
+        older = Content.objects.get(id=older.id)
+        self.assertTrue(older.delta)
+        self.assertEqual(older.full_body(), bodies[0])
+        self.assertIn("course 0,", older.render("latex"))
+        self.assertIn("course 0,", older.render("markdown"))
+
+    def test_migration_parser_frozen(self):
+        migration = importlib.import_module('editor.migrations.0007_content_parsed')
+        for formatting, body in [
+            (Content.Formatting.DATE_POINTS, "2019\nbuilt a thing\nshipped it\n\n2018\nplanned it"),
+            (Content.Formatting.ORG_LOC_TITLE_DATE_POINTS, "org\nloc\ntitle\n2019\ndid\nthings"),
+        ]:
+            self.assertEqual(migration.parse_body(formatting, body), parse_body(formatting, body))
+
+
+class RegenerateAllTestCase(FakeToolchainMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._profiles = [mommy.make(User) for _ in range(3)]
+        for profile in self._profiles:
+            mommy.make(Content, user=profile, section=Content.Section.NAME)
+        engines = {}
+
+        def engine():
+            # one per worker process, a forked copy would have no threads
+            return engines.setdefault(os.getpid(), CompileEngine(FAKE_PDFLATEX, workers=1))
+
+        patches = [
+            mock.patch('editor.management.commands.regenerate_all.artifact_cache', return_value=self.cache),
+            mock.patch('editor.models.compile_engine', side_effect=engine),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.checkpoint = os.path.join(self._dir, "checkpoint")
+        self.summary = os.path.join(self._dir, "summary.json")
+
+    def _regenerate(self, **options):
+        call_command(
+            'regenerate_all', workers=2, checkpoint=self.checkpoint,
+            summary=self.summary, stdout=io.StringIO(), **options
+        )
+        with open(self.summary) as f:
+            return json.load(f)
+
+    def test_regenerate_and_resume(self):
+        with open(self.checkpoint, "w") as f:
+            f.write(json.dumps({'user': self._profiles[0].user_id, 'ok': True}) + "\n")
+        summary = self._regenerate()
+        self.assertEqual(summary['users'], 2)
+        self.assertEqual(summary['compiled'], 2)
+        self.assertEqual(summary['failed'], 0)
+
+        summary = self._regenerate(restart=True)
+        self.assertEqual(summary['users'], 3)
+        self.assertEqual(summary['cached'], 2)
+
+    def test_failures_reported(self):
+        with mock.patch.dict(os.environ, {"FAKE_PDFLATEX_EXIT": "1"}):
+            summary = self._regenerate(restart=True)
+        self.assertEqual(summary['failed'], 3)
+        self.assertEqual(len(summary['failures']), 3)
+
+
+class RetentionTestCase(TestCase):
+
+    def setUp(self):
+        self._profile = mommy.make(User)
+        self._now = timezone.now().replace(hour=12, minute=0)
+        # ten revisions: four today, two yesterday, then a few older days
+        self._ids = []
+        for age in [0, 0, 0, 0, 1, 1, 2, 3, 40, 41]:
+            content = mommy.make(
+                Content, user=self._profile, section=Content.Section.COURSES, body="x" * 10
+            )
+            Content.objects.filter(id=content.id).update(
+                created=self._now - datetime.timedelta(days=age, seconds=len(self._ids))
+            )
+            self._ids.append(content.id)
+
+    def test_policy(self):
+        policy = retention.RetentionPolicy(keep_last=3, keep_daily=7)
+        (_, _, ids), = retention.prunable_ids(policy, self._now)
+        kept = set(self._ids) - set(ids)
+        # three newest, then the newest of each older day within a week
+        self.assertEqual(kept, set(self._ids[:3] + [self._ids[4], self._ids[6], self._ids[7]]))
+
+    def test_latest_always_kept(self):
+        policy = retention.RetentionPolicy(keep_last=0, keep_daily=0)
+        (_, _, ids), = retention.prunable_ids(policy, self._now)
+        self.assertEqual(set(self._ids) - set(ids), {self._ids[0]})
+        with self.assertRaises(CommandError):
+            call_command('compact_content', keep_last=0, stdout=io.StringIO())
+        self.assertEqual(Content.objects.count(), 10)
+
+    def test_compact_command(self):
+        out = io.StringIO()
+        call_command('compact_content', keep_last=2, keep_daily=0, dry_run=True, stdout=out)
+        self.assertIn("would delete 8 revisions", out.getvalue())
+        self.assertEqual(Content.objects.count(), 10)
+        call_command('compact_content', keep_last=2, keep_daily=0, batch_size=3, stdout=out)
+        self.assertEqual(
+            list(Content.objects.order_by('-created').values_list('id', flat=True)), self._ids[:2]
+        )
+
+
+class CreatedTimestampMigrationTestCase(TransactionTestCase):
+
+    def _migrate(self, target=None):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('editor', target)] if target else executor.loader.graph.leaf_nodes('editor'))
+
+    def test_legacy_dates_converted(self):
+        profile = mommy.make(User)
+        self._migrate('0004_generatejob')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO editor_content (user_id, section, body, formatting, created)"
+                " VALUES (%s, %s, %s, %s, %s)",
+                [profile.id, Content.Section.COURSES, "old course", Content.Formatting.TEXT, "2020-02-10"],
+            )
+        self._migrate()
+
+        legacy = Content.objects.get()
+        self.assertEqual(legacy.created, datetime.datetime(2020, 2, 10, tzinfo=datetime.timezone.utc))
+        Content.objects.create(user=profile, section=Content.Section.COURSES, body="new course")
+        retention.compact(retention.RetentionPolicy(keep_last=1, keep_daily=0))
+        self.assertEqual(list(Content.objects.values_list('body', flat=True)), ["new course"])
+
+
+@override_settings(REVISION_SNAPSHOT_INTERVAL=4)
+class RevisionTestCase(TestCase):
+
+    def setUp(self):
+        self._profile = mommy.make(User)
+        self._bodies = [
+            "\n".join("line {} rev {}".format(i, rev if i == rev else 0) for i in range(20))
+            for rev in range(10)
+        ]
+        self._revisions = [
+            Content.objects.create(user=self._profile, section=Content.Section.COURSES, body=body)
+            for body in self._bodies
+        ]
+
+    def test_delta_round_trip(self):
+        newer, older = "a\nb\nc\n", "a\nx\nc\nd"
+        self.assertEqual(revisions.apply_delta(newer, revisions.encode_delta(newer, older)), older)
+        self.assertEqual(revisions.apply_delta(older, revisions.encode_delta(older, "")), "")
+
+    def test_snapshots(self):
+        stored = Content.objects.order_by('created', 'id').values_list('delta', flat=True)
+        full = [i for i, delta in enumerate(stored) if not delta]
+        # the latest revision and every fourth one keep their body
+        self.assertEqual(full, [3, 7, 9])
+        self.assertEqual(Content.objects.get(id=self._revisions[-1].id).body, self._bodies[-1])
+
+    def test_overlapping_saves(self):
+        # both rows are inserted before either save stores its revision
+        with mock.patch('editor.revisions.store_revision'):
+            first, second = [
+                Content.objects.create(user=self._profile, section=Content.Section.COURSES, body=body)
+                for body in ["overlap a\n" + self._bodies[-1], "overlap b\n" + self._bodies[-1]]
+            ]
+        revisions.store_revision(first)
+        revisions.store_revision(second)
+        self.assertEqual(latest_content(self._profile.user, Content.Section.COURSES), second)
+        self.assertEqual(Content.objects.get(id=second.id).delta, "")
+        for content in [first, second] + self._revisions:
+            self.assertEqual(
+                revisions.revision_body(Content.objects.get(id=content.id)), content.body
+            )
+
+    def test_revision_body(self):
+        for content, body in zip(self._revisions, self._bodies):
+            self.assertEqual(revisions.revision_body(Content.objects.get(id=content.id)), body)
+
+    def test_list_and_diff(self):
+        listed = list(revisions.list_revisions(self._profile.id, Content.Section.COURSES))
+        self.assertEqual([r['id'] for r in listed], [c.id for c in reversed(self._revisions)])
+        self.assertNotIn('body', listed[0])
+        old, new = (Content.objects.get(id=c.id) for c in self._revisions[1:3])
+        diff = "".join(revisions.diff_revisions(old, new))
+        self.assertIn("-line 1 rev 1", diff)
+        self.assertIn("+line 2 rev 2", diff)
+
+    def test_compact_keeps_chains(self):
+        # keeps the newest two and drops everything the deltas were built on
+        retention.compact(retention.RetentionPolicy(keep_last=2, keep_daily=0))
+        self.assertEqual(Content.objects.count(), 2)
+        for content, body in zip(self._revisions[-2:], self._bodies[-2:]):
+            self.assertEqual(revisions.revision_body(Content.objects.get(id=content.id)), body)
+
+        Content.objects.all().delete()
+        self.setUp()
+        # dropping the middle of the history cuts the chains of the oldest two
+        ids = [c.id for c in self._revisions[2:9]]
+        revisions.detach(self._profile.id, Content.Section.COURSES, ids)
+        Content.objects.filter(id__in=ids).delete()
+        for content, body in [(self._revisions[i], self._bodies[i]) for i in (0, 1, 9)]:
+            self.assertEqual(revisions.revision_body(Content.objects.get(id=content.id)), body)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTestCase(TestCase):
+
+    def setUp(self):
+        self._profile = mommy.make(User)
+        for section in Resume.SECTION_CHOICES:
+            Content.objects.create(user=self._profile, section=section, body=section)
+        self.client.force_login(self._profile.user)
+        self._dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._dir)
+
+        def save_latex(resume):
+            # renders like the real one, without compiling
+            path = os.path.join(self._dir, "user-resume.pdf")
+            with open(path, "w") as f:
+                f.write(resume.render("latex"))
+            return path
+        self._save_latex = save_latex
+
+    def test_view_budgets(self):
+        self.assertEqual(self.client.get("/editor/").status_code, 200)
+        self.assertEqual(self.client.get("/editor/content/?section=Courses").status_code, 200)
+        for body in ["first", "second"]:
+            response = self.client.post(
+                "/editor/content/", {'section': "Courses", 'formatting': "text", 'body': body}
+            )
+            self.assertEqual(response.status_code, 200)
+        with mock.patch.object(Resume, 'save_latex', self._save_latex):
+            response = self.client.get("/editor/generate/")
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(int(response['X-Query-Count']), 4)
+
+    def test_async_view_budget(self):
+        save_latex = self._save_latex
+
+        async def asave_latex(resume):
+            return await sync_to_async(save_latex)(resume)
+
+        self.async_client.force_login(self._profile.user)
+        with mock.patch.object(Resume, 'asave_latex', asave_latex):
+            response = async_to_sync(self.async_client.get)("/editor/generate/async/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("total;dur=", response['Server-Timing'])
+        # queries run in sync_to_async threads are counted too
+        self.assertGreaterEqual(int(response['X-Query-Count']), 3)
+        self.assertLessEqual(int(response['X-Query-Count']), 4)
+
+    def test_repeated_queries_and_budget(self):
+        @query_budget(3)
+        def per_section(request):
+            for section in Resume.SECTION_CHOICES:
+                latest_content(self._profile.user, section)
+            return HttpResponse()
+
+        def get_response(request):
+            middleware.process_view(request, per_section, (), {})
+            return per_section(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        request = RequestFactory().get("/")
+        with self.assertLogs('editor.middleware', 'WARNING') as logs, \
+                self.assertRaises(QueryBudgetExceeded):
+            middleware(request)
+        self.assertIn("ran the same query {} times".format(len(Resume.SECTION_CHOICES)), logs.output[0])
+
+    def test_one_profile_lookup(self):
+        def profile_lookups(method, path, data=None):
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.client, method)(path, data)
+            self.assertEqual(response.status_code, 200)
+            return sum('FROM "editor_user"' in query['sql'] for query in queries)
+
+        self.assertEqual(profile_lookups('get', "/editor/"), 0)
+        self.assertEqual(profile_lookups('get', "/editor/content/", {'section': "Courses"}), 1)
+        self.assertEqual(profile_lookups(
+            'post', "/editor/content/", {'section': "Courses", 'formatting': "text", 'body': "new"}
+        ), 1)
+        with mock.patch.object(Resume, 'save_latex', self._save_latex):
+            self.assertEqual(profile_lookups('get', "/editor/generate/"), 1)
+
+        self.client.force_login(AuthUser.objects.create_user(username="no-profile"))
+        self.assertEqual(self.client.get("/editor/generate/").status_code, 404)
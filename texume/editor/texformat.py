@@ -0,0 +1,163 @@
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+from django.conf import settings
+
+from editor.artifacts import TemplateFingerprint
+from editor.compiler import run_supervised
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "resume-preamble"
+LOCK_NAME = ".lock"
+
+
+class PreambleFormat:
+    """
+    The preamble of user-resume.tex (document class, packages and macros, up
+    to the \\endofdump marker) dumped into a .fmt file with mylatexformat, so
+    each compile starts from a loaded preamble instead of parsing resume.cls
+    and its packages again.
+
+    Formats are kept in a directory per template fingerprint and rebuilt
+    when the template files change. Builds are serialized across processes
+    with a lock file in `format_dir` and moved into place once complete.
+    """
+
+    def __init__(self, src_dir: str, format_dir: str, command=("pdflatex",),
+                 timeout: float = 60.0, limits: Optional[dict] = None):
+        self.src_dir = os.path.abspath(src_dir)
+        self.format_dir = os.path.abspath(format_dir)
+        self.command = list(command)
+        self.timeout = timeout
+        self.limits = dict(limits or {})
+        self.fingerprint = TemplateFingerprint(self.src_dir)
+        self._lock = threading.Lock()
+        self._failed = set()
+        self._building = None  # background build started by prepare()
+
+    def path(self) -> str:
+        return os.path.join(
+            self.format_dir, self.fingerprint.digest[:16], FORMAT_NAME + ".fmt"
+        )
+
+    def is_stale(self) -> bool:
+        return not os.path.exists(self.path())
+
+    def ensure(self) -> Optional[str]:
+        """
+        Path of an up to date format file, building it first if needed.
+        Returns None when the format cannot be built, so callers fall back to
+        a plain compile.
+        """
+        path = self.path()
+        if os.path.exists(path):
+            return path
+        with self._lock:
+            if path in self._failed:
+                return None
+            os.makedirs(self.format_dir, exist_ok=True)
+            with open(os.path.join(self.format_dir, LOCK_NAME), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # released when closed
+                if not os.path.exists(path) and not self._build(path):
+                    self._failed.add(path)
+                    return None
+                self._remove_stale(path)
+            return path
+
+    def prepare(self):
+        """
+        Start building the format in a background thread unless it exists,
+        failed to build or is being built already.
+        """
+        path = self.path()
+        if os.path.exists(path) or path in self._failed:
+            return
+        with self._lock:
+            if self._building is not None and self._building.is_alive():
+                return
+            self._building = threading.Thread(
+                target=self.ensure, name="preamble-format", daemon=True
+            )
+            self._building.start()
+
+    def _build(self, path: str) -> bool:
+        build_dir = tempfile.mkdtemp(prefix=".build-", dir=self.format_dir)
+        command = self.command + [
+            "-ini",
+            "-interaction=batchmode",
+            "-jobname={}".format(FORMAT_NAME),
+            "-output-directory={}".format(build_dir),
+            "&pdflatex",
+            "mylatexformat.ltx",
+            "user-resume.tex",
+        ]
+        logger.info("building preamble format: {}".format(command))
+        try:
+            run = run_supervised(
+                command, self.src_dir, timeout=self.timeout, limits=self.limits
+            )
+            built = os.path.join(build_dir, FORMAT_NAME + ".fmt")
+            if run.return_code != 0 or not os.path.exists(built):
+                logger.warning("building preamble format failed: {}".format(run.return_code))
+                return False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(built, path)
+            return True
+        except OSError as e:
+            logger.warning("could not build preamble format: {}".format(e))
+            return False
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def _remove_stale(self, path: str):
+        current = os.path.dirname(path)
+        for name in os.listdir(self.format_dir):
+            stale = os.path.join(self.format_dir, name)
+            if name != LOCK_NAME and stale != current:
+                shutil.rmtree(stale, ignore_errors=True)
+
+    def compile_args(self) -> list:
+        """
+        Extra pdflatex arguments selecting the format, empty if unavailable.
+        Never waits for a build: a missing format is built in the background
+        and compiles run without it meanwhile.
+        """
+        if not settings.LATEX_USE_FORMAT:
+            return []
+        path = self.path()
+        if os.path.exists(path):
+            return ["-fmt={}".format(path)]
+        self.prepare()
+        return []
+
+
+def autostart():
+    """
+    Start building the format with the server, before the first compile
+    asks for it.
+    """
+    if settings.LATEX_USE_FORMAT:
+        preamble_format().prepare()
+
+
+_preamble_format = None
+_preamble_format_lock = threading.Lock()
+
+
+def preamble_format() -> PreambleFormat:
+    global _preamble_format
+    with _preamble_format_lock:
+        if _preamble_format is None:
+            _preamble_format = PreambleFormat(
+                settings.LATEX_SRC_DIR,
+                settings.LATEX_FORMAT_DIR,
+                command=settings.PDFLATEX_COMMAND,
+                limits=settings.COMPILE_LIMITS,
+            )
+        return _preamble_format
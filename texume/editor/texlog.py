@@ -0,0 +1,127 @@
+import os
+import re
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# ./user-data.tex:12: Undefined control sequence.
+FILE_LINE_ERROR = re.compile(r"^(?P<file>\.?/?[^:\s]+\.(?:tex|cls|sty)):(?P<line>\d+): (?P<message>.*)$")
+# ! LaTeX Error: File `foo.sty' not found.
+BANG_ERROR = re.compile(r"^! (?P<message>.*)$")
+# l.12 \textbf{unfinished
+CONTEXT_LINE = re.compile(r"^l\.(?P<line>\d+) ?(?P<context>.*)$")
+
+CONTEXT_LOOKAHEAD = 8  # lines after an error searched for its l.NN context
+
+
+class Diagnostic(NamedTuple):
+    message: str
+    file: Optional[str] = None
+    line: Optional[int] = None
+    context: str = ""
+    section: Optional[str] = None
+    section_line: Optional[int] = None  # line within the rendered section
+
+    def __str__(self):
+        where = self.section or self.file or "resume"
+        if self.section_line is not None:
+            where += " line {}".format(self.section_line)
+        elif self.line is not None:
+            where += " line {}".format(self.line)
+        return "{}: {}{}".format(
+            where, self.message, " ({})".format(self.context) if self.context else ""
+        )
+
+
+def parse_log(lines: Iterable[str]) -> Iterator[Diagnostic]:
+    """
+    Stream the errors out of a pdflatex log, one line at a time.
+    """
+    pending = None
+    lookahead = 0
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if pending is not None:
+            match = CONTEXT_LINE.match(line)
+            lookahead -= 1
+            if match:
+                yield pending._replace(
+                    line=pending.line or int(match.group('line')),
+                    context=match.group('context').strip(),
+                )
+                pending = None
+                continue
+            if lookahead <= 0 or FILE_LINE_ERROR.match(line) or BANG_ERROR.match(line):
+                yield pending
+                pending = None
+
+        match = FILE_LINE_ERROR.match(line)
+        if match:
+            pending = Diagnostic(
+                message=match.group('message').strip(),
+                file=os.path.basename(match.group('file')),
+                line=int(match.group('line')),
+            )
+            lookahead = CONTEXT_LOOKAHEAD
+            continue
+        match = BANG_ERROR.match(line)
+        if match:
+            pending = Diagnostic(message=match.group('message').strip())
+            lookahead = CONTEXT_LOOKAHEAD
+    if pending is not None:
+        yield pending
+
+
+def read_log(path: str) -> List[Diagnostic]:
+    try:
+        with open(path, errors="replace") as log:
+            return list(parse_log(log))
+    except FileNotFoundError:
+        return []
+
+
+RERUN_WARNING = re.compile(r"Rerun to get|Label\(s\) may have changed|Rerun LaTeX")
+
+
+def needs_rerun(path: str) -> bool:
+    """
+    Whether a pdflatex log asks for another pass to settle references.
+    """
+    try:
+        with open(path, errors="replace") as log:
+            return any(RERUN_WARNING.search(line) for line in log)
+    except FileNotFoundError:
+        return False
+
+
+class SourceMap:
+    """
+    Maps lines of the generated user-data.tex (or `data_file`), and of the
+    section commands in user-resume.tex, back to the resume section that
+    produced them.
+    """
+
+    def __init__(self, fragments: List[Tuple[str, str]], commands: dict,
+                 data_file: str = "user-data.tex"):
+        self.data_file = data_file
+        self.regions = []  # (first line, last line, section), 1-based
+        start = 1
+        for section, text in fragments:
+            num_lines = text.count("\n")
+            self.regions.append((start, start + max(num_lines - 1, 0), section))
+            start += num_lines
+        self.commands = commands  # macro name -> section
+
+    def locate(self, diagnostic: Diagnostic) -> Diagnostic:
+        if diagnostic.line is None:
+            return diagnostic
+        if diagnostic.file == self.data_file:
+            for first, last, section in self.regions:
+                if first <= diagnostic.line <= last:
+                    return diagnostic._replace(
+                        section=section, section_line=diagnostic.line - first + 1
+                    )
+        elif diagnostic.file == "user-resume.tex":
+            # errors inside a section body surface where its macro is expanded
+            for command, section in self.commands.items():
+                if re.search(r"\\{}\b".format(command), diagnostic.context):
+                    return diagnostic._replace(section=section)
+        return diagnostic
@@ -6,6 +6,12 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('content/', views.content, name='content'),
+    path('content/preview/', views.preview_section, name='preview'),
     path('generate/', views.generate, name='generate'),
+    path('generate/async/', views.generate_async, name='generate-async'),
+    path('generate/jobs/', views.submit_job, name='job-submit'),
+    path('generate/jobs/<int:job_id>/', views.job_status, name='job-status'),
+    path('generate/jobs/<int:job_id>/pdf', views.job_download, name='job-download'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('accounts/login/', auth_views.LoginView.as_view()),
 ]
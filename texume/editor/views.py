@@ -1,11 +1,21 @@
+import hmac
 import logging
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
 from django.http import HttpResponse, Http404
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import render
-from django.http import HttpResponseRedirect, FileResponse, Http404
+from django.shortcuts import render, get_object_or_404
+from django.http import HttpResponseRedirect, Http404, JsonResponse
+from django.urls import reverse
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 
-from .models import Content, User, Resume, latest_content, authuser_is_user
+from . import delivery, jobs, metrics, preview
+from .compiler import CompilerBusy
+from .middleware import query_budget
+from .models import Content, Resume, GenerateJob, CompileError, latest_content
 from editor.forms import PartialContentForm
 
 logger = logging.getLogger("EDITOR")
@@ -13,6 +23,11 @@ logger = logging.getLogger("EDITOR")
 
 SECTION_CHOICES = [x for x, _ in Content.Section.choices]
 
+# per-user output that browsers and proxies may keep, but must revalidate
+# (cheap, see generate) before reusing
+GENERATE_CACHE_CONTROL = {'private': True, 'no_cache': True}
+
+@query_budget(2)  # session, user
 @login_required
 def index(request):
     user_sections = [
@@ -23,26 +38,206 @@ def index(request):
         request, "editor/form.html", {"user_sections": user_sections}
     )
 
+@query_budget(4)  # session, user, profile, latest contents
 @login_required
 def generate(request):
-    if not authuser_is_user(request.user):
+    if not request.profile:
         raise Http404("user does not have a profile, contact admin")
     mode = request.GET.get('mode', 'pdf')
     if mode not in ('latex', 'markdown', 'pdf'):
         raise Http404("invalid mode")
     if request.method == 'GET':
-        resume = Resume(request.user)
-        output_file = resume.save_latex()
+        resume = Resume(request.user, profile=request.profile)
+        etag, last_modified = _validators(resume, mode)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            if mode == 'pdf':
+                try:
+                    response = _pdf_response(request, resume.save_latex(), etag)
+                except (CompilerBusy, CompileError) as e:
+                    response = _compile_failed(request, e)
+            else:
+                response = _rendered_response(request, resume, mode)
+        return _cache_headers(response, etag, last_modified)
+
+@query_budget(4)  # session, user, profile, latest contents
+async def generate_async(request):
+    """
+    generate for ASGI servers: pdf compiles are awaited rather than holding
+    a thread each, so one worker keeps many in flight; database access goes
+    through sync_to_async
+    """
+    if not await sync_to_async(lambda: request.user.is_authenticated)():
+        return redirect_to_login(request.get_full_path())
+    if not await sync_to_async(bool)(request.profile):
+        raise Http404("user does not have a profile, contact admin")
+    mode = request.GET.get('mode', 'pdf')
+    if mode not in ('latex', 'markdown', 'pdf'):
+        raise Http404("invalid mode")
+    if request.method != 'GET':
+        raise Http404("Invalid method: {}".format(request.method))
+    resume = Resume(request.user, profile=request.profile)
+    etag, last_modified = await sync_to_async(_validators)(resume, mode)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
         if mode == 'pdf':
             try:
-                response = FileResponse(open(output_file, 'rb'), content_type='application/pdf')
-                return response
-            except FileNotFoundError:
-                raise Http404()
+                response = _pdf_response(request, await resume.asave_latex(), etag)
+            except (CompilerBusy, CompileError) as e:
+                response = _compile_failed(request, e)
         else:
-            rendered = resume.render(mode)
-            return render(request, "editor/generated.html", {mode:rendered})
+            response = await sync_to_async(_rendered_response)(request, resume, mode)
+    return _cache_headers(response, etag, last_modified)
+
+def _validators(resume, mode):
+    """
+    ETag and Last-Modified need only the latest content ids, so an unchanged
+    resume is answered with a 304 before any render or compile
+    """
+    return resume.etag(mode), int(resume.last_modified(mode))
+
+def _cache_headers(response, etag, last_modified):
+    if response.status_code in (200, 206, 304):
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, **GENERATE_CACHE_CONTROL)
+    else:
+        add_never_cache_headers(response)
+    return response
+
+def _compile_failed(request, error):
+    if isinstance(error, CompilerBusy):
+        response = HttpResponse("busy compiling other resumes, retry shortly", status=503)
+        response['Retry-After'] = '5'
+        return response
+    return render(
+        request, "editor/compile-errors.html",
+        {"error": error, "diagnostics": error.diagnostics}, status=422
+    )
+
+def _pdf_response(request, path, etag, content_type='application/pdf'):
+    with metrics.stage("respond"):
+        try:
+            return delivery.pdf_response(request, path, etag, content_type)
+        except FileNotFoundError:
+            # evicted since the lookup, rare enough to let the client retry
+            response = HttpResponse("resume expired from the cache, retry", status=503)
+            response['Retry-After'] = '1'
+            return response
+
+def _rendered_response(request, resume, mode):
+    rendered = resume.render(mode)
+    with metrics.stage("respond"):
+        return render(request, "editor/generated.html", {mode:rendered})
+
+@query_budget(4)  # session, user, profile, latest content
+@login_required
+def preview_section(request):
+    """
+    GET with section=x previews the saved section, POST previews the form
+    contents without saving them; image=png returns a thumbnail instead of
+    the pdf
+    """
+    if not request.method in ('GET', 'POST'):
+        raise Http404("Invalid method: {}".format(request.method))
+    if not request.profile:
+        raise Http404("User does not have a profile, contact admin")
+    params = getattr(request, request.method)
+    image_format = params.get('image', 'pdf')
+    if image_format not in preview.PREVIEW_FORMATS:
+        raise Http404("invalid image format")
+    section = params.get('section', None)
+    if section not in SECTION_CHOICES or not preview.can_preview(section):
+        raise Http404("section with a preview required")
+
+    if request.method == 'POST':
+        form = PartialContentForm(request.POST, instance=Content(user=request.profile))
+        if not form.is_valid():
+            return render(request, 'editor/content-form.html', {'form': form}, status=400)
+        content = form.save(commit=False)
+        etag = None
+    else:
+        content = latest_content(request.user, section, profile=request.profile)
+        etag = '"{}"'.format(preview.preview_key(content)[:32])
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return _cache_headers(not_modified, etag, None)
+
+    try:
+        path = preview.compile_preview(content, image_format)
+    except (CompilerBusy, CompileError) as e:
+        response = _compile_failed(request, e)
+    except preview.PreviewError as e:
+        logger.warning(str(e))
+        response = HttpResponse(str(e), status=500)
+    else:
+        _, content_type = preview.PREVIEW_FORMATS[image_format]
+        response = _pdf_response(request, path, etag, content_type)
+    return _cache_headers(response, etag, None)
+
+def _metrics_allowed(request):
+    if settings.METRICS_TOKEN:
+        authorization = request.META.get('HTTP_AUTHORIZATION', "")
+        return hmac.compare_digest(authorization, "Bearer " + settings.METRICS_TOKEN)
+    # proxied requests arrive from the proxy's (often local) address
+    if 'HTTP_X_FORWARDED_FOR' in request.META or 'HTTP_X_REAL_IP' in request.META:
+        return False
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_ADDRESSES
+
+def metrics_view(request):
+    """
+    Stage histograms and compile counters in the Prometheus text format,
+    for scrapers sending METRICS_TOKEN as a bearer token, or without one
+    set, for direct requests from METRICS_ALLOWED_ADDRESSES
+    """
+    if not _metrics_allowed(request):
+        raise Http404()
+    return HttpResponse(
+        metrics.registry().exposition(), content_type='text/plain; version=0.0.4'
+    )
+
+def _job_status(job):
+    status = {'id': job.id, 'status': job.status}
+    if job.status == GenerateJob.Status.DONE:
+        status['download'] = reverse('job-download', args=[job.id])
+    elif job.status == GenerateJob.Status.FAILED:
+        status['error'] = job.error
+    return status
+
+@login_required
+def submit_job(request):
+    """
+    POST to queue a pdf compile, returns the job id without waiting for it
+    """
+    if request.method != 'POST':
+        raise Http404("Invalid method: {}".format(request.method))
+    if not request.profile:
+        raise Http404("user does not have a profile, contact admin")
+    job = jobs.submit(request.profile)
+    response = JsonResponse(_job_status(job), status=202)
+    response['Location'] = reverse('job-status', args=[job.id])
+    return response
+
+@login_required
+def job_status(request, job_id):
+    job = get_object_or_404(GenerateJob, id=job_id, user__user=request.user)
+    return JsonResponse(_job_status(job))
+
+@login_required
+def job_download(request, job_id):
+    job = get_object_or_404(
+        GenerateJob, id=job_id, user__user=request.user, status=GenerateJob.Status.DONE
+    )
+    try:
+        return delivery.pdf_response(request, job.artifact)
+    except FileNotFoundError:
+        raise Http404("artifact expired, submit the job again")
 
+# session, user, profile, latest content; saving adds the insert and up to
+# three queries storing the previous revision as a delta
+@query_budget(8)
 @login_required
 def content(request):
     """
@@ -52,19 +247,20 @@ def content(request):
     if not request.method in ('GET', 'POST'):
         raise Http404("Invalid method: {}".format(request.method))
 
-    if not authuser_is_user(request.user):
+    if not request.profile:
         raise Http404("User does not have a profile, contact admin")
 
     section = getattr(request, request.method).get('section', None)
     if section not in SECTION_CHOICES:
         raise Http404("valid section required")
-    content = latest_content(request.user, section)
+    content = latest_content(request.user, section, profile=request.profile)
 
     if request.method == 'POST':
-        form = PartialContentForm(request.POST, instance=content)
+        # every save is a new row, earlier revisions stay untouched
+        form = PartialContentForm(request.POST, instance=Content(user=request.profile))
         if form.is_valid():
             logging.info("creating record with data: {}".format(form.save(commit=False)))
-            form.save()
+            content = form.save()
 
     form = PartialContentForm(instance=content)
     return render(request, 'editor/content-form.html', {'form': form})
@@ -0,0 +1,177 @@
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Workspace:
+    """
+    Scratch directories for compiles. The templates stay in one shared,
+    read-only directory that TeX finds through TEXINPUTS; a compile only
+    writes user-data.tex and its outputs into its own scratch directory.
+    """
+
+    def __init__(self, src_dir: str, scratch_root: str,
+                 max_age: float = 3600.0, max_bytes: int = 512 * 1024 * 1024,
+                 aux_root: Optional[str] = None):
+        self.src_dir = os.path.abspath(src_dir)
+        self.scratch_root = os.path.abspath(scratch_root)
+        self.aux_root = os.path.abspath(aux_root or os.path.join(scratch_root, os.pardir, "aux"))
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def env(self) -> dict:
+        """
+        Environment for pdflatex: the scratch directory first, then the
+        templates, then the TeX defaults (the trailing separator).
+        """
+        env = dict(os.environ)
+        env['TEXINPUTS'] = os.pathsep.join([".", self.src_dir, ""])
+        return env
+
+    def aux_state(self, user_id: int) -> 'AuxState':
+        return AuxState(os.path.join(self.aux_root, "user{}".format(user_id)))
+
+    @contextlib.contextmanager
+    def scratch(self, prefix: str = "compile_"):
+        os.makedirs(self.scratch_root, exist_ok=True)
+        path = tempfile.mkdtemp(dir=self.scratch_root, prefix=prefix)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def sweep(self) -> int:
+        """
+        Remove scratch directories older than max_age, then the oldest ones
+        until the rest fit in max_bytes. Returns the number removed.
+        """
+        if not os.path.isdir(self.scratch_root):
+            return 0
+        entries = []
+        for name in os.listdir(self.scratch_root):
+            path = os.path.join(self.scratch_root, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, path, _tree_size(path)))
+        entries.sort()
+
+        removed = 0
+        now = time.time()
+        total = sum(size for _, _, size in entries)
+        for mtime, path, size in entries:
+            if now - mtime < self.max_age and total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            logger.info("swept {} scratch directories".format(removed))
+        return removed
+
+
+def _tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class AuxState:
+    """
+    A user's .aux/.out/.brf files kept between compiles, so the next compile
+    starts from the previous cross-reference state instead of from scratch.
+    """
+
+    FILES = ["user-resume.aux", "user-resume.out", "user-resume.brf"]
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def restore(self, working_directory: str) -> bool:
+        restored = False
+        for name in self.FILES:
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                shutil.copyfile(path, os.path.join(working_directory, name))
+                restored = True
+        return restored
+
+    def save(self, working_directory: str):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in self.FILES:
+            source = os.path.join(working_directory, name)
+            target = os.path.join(self.directory, name)
+            if os.path.exists(source):
+                partial = "{}.{}.part".format(target, threading.get_ident())
+                shutil.copyfile(source, partial)
+                os.replace(partial, target)
+            elif os.path.exists(target):
+                os.remove(target)
+
+    @classmethod
+    def digest(cls, working_directory: str) -> Optional[str]:
+        """
+        Hash of the aux files in a working directory, None if there are none.
+        """
+        sha = hashlib.sha256()
+        found = False
+        for name in cls.FILES:
+            path = os.path.join(working_directory, name)
+            if os.path.exists(path):
+                found = True
+                sha.update(name.encode())
+                with open(path, 'rb') as f:
+                    sha.update(f.read())
+        return sha.hexdigest() if found else None
+
+
+class Sweeper(threading.Thread):
+
+    def __init__(self, workspace: Workspace, interval: float):
+        super().__init__(name="workspace-sweeper", daemon=True)
+        self.workspace = workspace
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.workspace.sweep()
+            except Exception:
+                logger.exception("workspace sweep failed")
+
+
+_workspace = None
+_workspace_lock = threading.Lock()
+
+
+def workspace() -> Workspace:
+    global _workspace
+    with _workspace_lock:
+        if _workspace is None:
+            _workspace = Workspace(
+                settings.LATEX_SRC_DIR,
+                settings.LATEX_SCRATCH_DIR,
+                max_age=settings.LATEX_SCRATCH_MAX_AGE,
+                max_bytes=settings.LATEX_SCRATCH_MAX_BYTES,
+                aux_root=settings.LATEX_AUX_DIR,
+            )
+            _workspace.sweep()
+            Sweeper(_workspace, settings.LATEX_SCRATCH_SWEEP_INTERVAL).start()
+        return _workspace
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'texume.settings')
 
 application = get_asgi_application()
+
+from editor import jobs, texformat  # noqa: E402, needs the apps loaded
+
+jobs.autostart()
+texformat.autostart()
@@ -41,11 +41,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'editor.middleware.ServerTimingMiddleware',
+    'editor.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'editor.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -82,6 +85,24 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # rendered Content fragments, see editor.models.Content.render
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+FRAGMENT_CACHE = 'fragments'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -141,3 +162,85 @@ LOGGING = {
 }
 
 X_FRAME_OPTIONS = 'SAMEORIGIN'
+
+
+# Content history, see editor.retention and manage.py compact_content
+
+CONTENT_RETENTION = {
+    'keep_last': 20,  # newest revisions per (user, section)
+    'keep_daily': 30,  # days with one snapshot kept beyond those
+}
+
+# every n-th revision keeps its full body, the rest are stored as deltas
+REVISION_SNAPSHOT_INTERVAL = 10
+
+
+# Resume compilation
+
+LATEX_SRC_DIR = os.path.join(os.path.dirname(BASE_DIR), 'src')
+
+PDFLATEX_COMMAND = ['pdflatex']
+COMPILE_WORKERS = 2
+COMPILE_QUEUE_SIZE = 8
+COMPILE_TIMEOUT = 10.0  # seconds
+# compiles in flight per event loop for the async generate view, see
+# editor.compiler.AsyncCompileEngine
+ASYNC_COMPILE_CONCURRENCY = 8
+ASYNC_COMPILE_QUEUE_SIZE = 32
+# resource limits for each pdflatex process, see editor.compiler.RLIMITS
+COMPILE_LIMITS = {
+    'cpu': 20,
+    'memory': 1024 * 1024 * 1024,
+    'output': 64 * 1024 * 1024,
+    'files': 256,
+}
+
+# compiles only write into a scratch directory, point this at tmpfs
+# (e.g. /dev/shm/texume) to keep them off the disk
+LATEX_SCRATCH_DIR = os.path.join(BASE_DIR, 'wd', 'scratch')
+LATEX_SCRATCH_MAX_AGE = 60 * 60  # seconds
+LATEX_SCRATCH_MAX_BYTES = 512 * 1024 * 1024
+LATEX_SCRATCH_SWEEP_INTERVAL = 10 * 60  # seconds
+
+# per-user .aux state kept between compiles for incremental cross-references
+LATEX_AUX_DIR = os.path.join(BASE_DIR, 'wd', 'aux')
+LATEX_MAX_PASSES = 3
+LATEX_DRAFT_PASS = True  # first pass without aux state skips writing the pdf
+
+# preamble dumped once with mylatexformat, see editor.texformat
+LATEX_USE_FORMAT = True
+LATEX_FORMAT_DIR = os.path.join(BASE_DIR, 'wd', 'formats')
+
+# start the job worker with the server (texume/wsgi.py, texume/asgi.py)
+JOB_WORKER_AUTOSTART = True
+JOB_POLL_INTERVAL = 5.0  # seconds
+# longer than any compile can take, queue wait and LATEX_MAX_PASSES included
+JOB_LEASE = 300.0  # seconds
+
+# compile in the background once a user stops saving, see editor.precompile
+PRECOMPILE_ENABLED = True
+PRECOMPILE_DELAY = 2.0  # seconds after the last save
+PRECOMPILE_MAX_DELAY = 10.0  # seconds after the first save of a burst
+
+PDF_CACHE_DIR = os.path.join(BASE_DIR, 'wd', 'pdf-cache')
+PDF_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# hand PDF downloads to the front-end server, see editor.delivery:
+# None, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+PDF_OFFLOAD = None
+# internal nginx location aliased to PDF_CACHE_DIR, for x-accel-redirect
+PDF_OFFLOAD_PREFIX = '/protected/pdf-cache/'
+
+# section previews, see editor.preview; pdftoppm is part of poppler-utils
+PREVIEW_RASTERIZE_COMMAND = ['pdftoppm', '-png', '-singlefile', '-scale-to', '800']
+
+# Metrics, see editor.metrics. Behind a proxy on the same box every request
+# comes from loopback, so set a token (Prometheus' bearer_token) or block
+# /editor/metrics in the proxy; requests with forwarding headers are refused
+# when no token is set.
+METRICS_TOKEN = os.environ.get('TEXUME_METRICS_TOKEN')
+METRICS_ALLOWED_ADDRESSES = ['127.0.0.1', '::1']
+
+# per-request SQL counting for development, see editor.middleware.query_budget
+QUERY_BUDGET_ENABLED = DEBUG
+QUERY_BUDGET_STRICT = False  # raise when a view goes over its budget
+QUERY_REPEAT_THRESHOLD = 3  # the same query this often in a request is logged
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'texume.settings')
 
 application = get_wsgi_application()
+
+from editor import jobs, texformat  # noqa: E402, needs the apps loaded
+
+jobs.autostart()
+texformat.autostart()